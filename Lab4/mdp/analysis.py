@@ -0,0 +1,63 @@
+import collections
+import numpy as np
+from typing import Dict, Any
+from mdp import MDP, BlackjackMDP
+from compiled_mdp import CompiledMDP, compileMDP
+
+
+def analyzePolicy(mdp: MDP, pi: Dict[Any, Any], compiled: CompiledMDP = None) -> Dict[str, Any]:
+    """Exact outcome statistics of following |pi| from mdp.startState(),
+    computed by pushing probability mass forward through the compiled policy
+    graph (see CompiledMDP.occupancy) instead of sampling.  Returns
+      -- visitation: state -> expected number of visits (only states visited)
+      -- terminal_distribution: state -> probability that the episode ends there
+      -- terminal_rewards: reward -> probability of receiving it on the final transition
+      -- action_counts: action -> expected number of times it is taken
+      -- expected_return: expected discounted return, i.e. V_pi(start)
+    The policy graph must be acyclic, as it is for BlackjackMDP."""
+    if compiled is None:
+        compiled = compileMDP(mdp)
+    rows = compiled.policyRows(pi)
+    start = compiled.stateIndex[mdp.startState()]
+    visits, flow = compiled.occupancy(rows, start)
+
+    # A state ends the episode if the policy's row there has no transitions.
+    safeRows = np.maximum(rows, 0)
+    counts = np.where(rows >= 0, compiled.rowPtr[safeRows + 1] - compiled.rowPtr[safeRows], 0)
+    terminal = counts == 0
+    visited = np.flatnonzero(visits > 0)
+
+    terminalRewards = collections.defaultdict(float)
+    intoTerminal = (flow > 0) & terminal[compiled.nextState]
+    for reward, mass in zip(compiled.reward[intoTerminal].tolist(), flow[intoTerminal].tolist()):
+        terminalRewards[reward] += mass
+
+    actionCounts = collections.defaultdict(float)
+    acting = visited[~terminal[visited]]
+    for action, mass in zip(compiled.rowAction[rows[acting]].tolist(), visits[acting].tolist()):
+        actionCounts[compiled.actionList[action]] += mass
+
+    expectedReturn = float(np.sum(flow * compiled.reward))
+    if compiled.discount != 1:
+        _, discountedFlow = compiled.occupancy(rows, start, compiled.discount)
+        expectedReturn = float(np.sum(discountedFlow * compiled.reward))
+    visitedStates = compiled.statesAt(visited)
+    return {
+        "visitation": dict(zip(visitedStates, visits[visited].tolist())),
+        "terminal_distribution": {state: float(visits[i]) for state, i in zip(visitedStates, visited.tolist()) if terminal[i]},
+        "terminal_rewards": dict(sorted(terminalRewards.items())),
+        "action_counts": dict(actionCounts),
+        "expected_return": expectedReturn,
+    }
+
+
+def blackjackOutcomes(mdp: BlackjackMDP, analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """Summarize analyzePolicy results for a BlackjackMDP: the distribution of
+    final hand totals and the probability of going bust."""
+    finalTotals = collections.defaultdict(float)
+    bust = 0.0
+    for (total, peekIndex, deck), probability in analysis["terminal_distribution"].items():
+        finalTotals[total] += probability
+        if total > mdp.threshold:
+            bust += probability
+    return {"final_totals": dict(sorted(finalTotals.items())), "bust_probability": bust}
@@ -0,0 +1,184 @@
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
+import sys
+import time
+import tracemalloc
+from main import ALGORITHMS, create_mdp
+
+
+# Parameter grids swept by the benchmark.  Each MDP type maps create_mdp keyword
+# arguments to the list of values to try; every combination is one configuration.
+GRIDS = {
+    "quick": {
+        "numberline": {"n": [5, 50, 500]},
+        "blackjack": {
+            "card_values": [[1, 5], [1, 2, 3, 4, 5]],
+            "multiplicity": [2, 3],
+            "threshold": [10, 15],
+            "peek_cost": [1],
+        },
+    },
+    "full": {
+        "numberline": {"n": [5, 50, 500, 2000]},
+        "blackjack": {
+            "card_values": [[1, 5], [1, 2, 3, 4, 5], [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]],
+            "multiplicity": [2, 3, 4],
+            "threshold": [15, 21],
+            "peek_cost": [1, 3],
+        },
+    },
+}
+
+# Fields that identify a result row when comparing against a baseline.
+KEY_FIELDS = ("mdp", "params", "algorithm")
+
+
+def grid_configurations(grid):
+    """Yield (mdp_type, params) for every combination in |grid|."""
+    for mdp_type, space in grid.items():
+        names = list(space)
+        for values in itertools.product(*(space[name] for name in names)):
+            yield mdp_type, dict(zip(names, values))
+
+
+def solve_quietly(mdp_type, params, algorithm_type):
+    mdp = create_mdp(mdp_type, **params)
+    algorithm = ALGORITHMS[algorithm_type]()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        algorithm.solve(mdp)
+    return mdp, algorithm, time.perf_counter() - start
+
+
+def peak_solve_memory(mdp_type, params, algorithm_type):
+    """Peak traced memory of a fresh solve.  tracemalloc slows solves down
+    several times, so this solve is separate from the timed one."""
+    tracemalloc.start()
+    try:
+        solve_quietly(mdp_type, params, algorithm_type)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# Result row columns: |states| is the number of states the solver returned
+# values for -- every reachable state, except for lao_star, which only values
+# the envelope of its optimal policy.  solve_time and states_per_second come
+# from an untraced solve; peak_memory_bytes from a second, traced one.
+def run_one(mdp_type, params, algorithm_type, measure_memory=True):
+    """Solve one configuration with one algorithm and return its result row."""
+    mdp, algorithm, solve_time = solve_quietly(mdp_type, params, algorithm_type)
+    peak_memory = peak_solve_memory(mdp_type, params, algorithm_type) if measure_memory else None
+
+    trace = algorithm.trace()
+    num_states = len(algorithm.V)
+    start_state = mdp.startState()
+    return {
+        "mdp": mdp_type,
+        "params": json.dumps(params, sort_keys=True),
+        "algorithm": algorithm_type,
+        "states": num_states,
+        "enumeration_time": trace["phase_times"].get("enumeration", 0.0),
+        "solve_time": solve_time,
+        "iterations": algorithm.numIters,
+        "peak_memory_bytes": peak_memory,
+        "states_per_second": num_states / solve_time if solve_time > 0 else None,
+        "start_value": algorithm.V[start_state],
+    }
+
+
+def run_benchmark(grid, algorithms, measure_memory=True, log=print):
+    rows = []
+    for mdp_type, params in grid_configurations(grid):
+        for algorithm_type in algorithms:
+            row = run_one(mdp_type, params, algorithm_type, measure_memory)
+            log(f"{mdp_type} {row['params']} {algorithm_type}: {row['states']} states, {row['solve_time']:.3f}s, {row['iterations']} iterations")
+            rows.append(row)
+    return rows
+
+
+def write_results(rows, path):
+    """Write result rows as JSON or CSV, chosen by the file extension."""
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else list(KEY_FIELDS))
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+def read_results(path):
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        for row in rows:
+            for field in ("solve_time", "start_value"):
+                row[field] = float(row[field])
+        return rows
+    with open(path) as f:
+        return json.load(f)
+
+
+def check_regressions(rows, baseline_rows, tolerance=0.25, min_delta=0.05, value_tolerance=1e-6):
+    """Compare |rows| against a baseline and return a list of regression messages.
+
+    A row regresses if its solve time exceeds the baseline by more than
+    |tolerance| (relative) and |min_delta| seconds (to ignore timer noise on tiny
+    configurations), or if its start-state value moved by more than
+    |value_tolerance|.  Rows missing from the baseline are skipped.
+    """
+    baseline = {tuple(row[field] for field in KEY_FIELDS): row for row in baseline_rows}
+    regressions = []
+    for row in rows:
+        key = tuple(row[field] for field in KEY_FIELDS)
+        if key not in baseline:
+            continue
+        old = baseline[key]
+        if row["solve_time"] > old["solve_time"] * (1 + tolerance) and row["solve_time"] - old["solve_time"] > min_delta:
+            regressions.append(f"{' '.join(key)}: solve time {old['solve_time']:.3f}s -> {row['solve_time']:.3f}s")
+        if abs(row["start_value"] - old["start_value"]) > value_tolerance:
+            regressions.append(f"{' '.join(key)}: start value {old['start_value']:.6f} -> {row['start_value']:.6f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MDP solvers over parameter grids")
+    parser.add_argument("--grid", choices=list(GRIDS), default="quick", help="Built-in parameter grid to sweep")
+    parser.add_argument("--grid-json", default=None, help="JSON file with a custom grid ({mdp_type: {param: [values]}})")
+    parser.add_argument("--algorithms", nargs="+", choices=list(ALGORITHMS), default=list(ALGORITHMS), help="Algorithms to benchmark")
+    parser.add_argument("--output", default="benchmark_results.json", help="Results file (.json or .csv)")
+    parser.add_argument("--baseline", default=None, help="Baseline results file to check for regressions")
+    parser.add_argument("--save-baseline", action="store_true", help="Also write the results to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative solve-time slowdown before a regression is reported")
+    parser.add_argument("--skip-memory", action="store_true", help="Do not measure peak memory, which takes a second, traced solve per row")
+    args = parser.parse_args()
+
+    grid = GRIDS[args.grid]
+    if args.grid_json:
+        with open(args.grid_json) as f:
+            grid = json.load(f)
+
+    rows = run_benchmark(grid, args.algorithms, measure_memory=not args.skip_memory)
+    write_results(rows, args.output)
+    print(f"Wrote {len(rows)} results to {args.output}")
+
+    if args.baseline and args.save_baseline:
+        write_results(rows, args.baseline)
+        print(f"Saved baseline to {args.baseline}")
+    elif args.baseline:
+        regressions = check_regressions(rows, read_results(args.baseline), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import json, os, pickle
+import numpy as np
+from typing import List, Tuple, Dict, Any
+
+
+# On-disk snapshot of a solver's V, pi and iteration counter.
+# A checkpoint directory holds
+#   -- states.pkl: the state list (index order) and action list, written once
+#   -- values.npy: float64 memory-mapped array, V[i] for states[i]
+#   -- policy.npy: int32 memory-mapped array, index into the action list (-1 = None)
+#   -- meta.json: algorithm name, iteration counter, whether the solve finished
+# The arrays are updated in place and meta.json is replaced atomically last, so
+# an interruption mid-save leaves values from two consecutive iterations mixed
+# together.  Value and policy iteration converge from any starting V and pi,
+# so resuming from such a snapshot is still correct; only the counter lags.
+class SolverCheckpoint:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.states = None
+        self.stateIndex = None
+        self.actionList = None
+        self.values = None
+        self.policy = None
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path("meta.json"))
+
+    def save(self, algorithm: str, states, V: Dict[Any, float], pi: Dict[Any, Any], numIters: int, complete: bool = False):
+        if self.states is None or len(self.states) != len(V):
+            self.create(list(states), pi)
+        self.values[:] = [V[state] for state in self.states]
+        if pi is not None:
+            actionCodes = {action: i for i, action in enumerate(self.actionList)}
+            for state, action in pi.items():
+                if action is not None and action not in actionCodes:
+                    actionCodes[action] = len(self.actionList)
+                    self.actionList.append(action)
+                    self.writeStates()
+            self.policy[:] = [actionCodes[pi[state]] if pi.get(state) is not None else -1 for state in self.states]
+        self.values.flush()
+        self.policy.flush()
+        meta = {"algorithm": algorithm, "iteration": numIters, "numStates": len(self.states), "hasPolicy": pi is not None, "complete": complete}
+        tmpPath = self.path("meta.json.tmp")
+        with open(tmpPath, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmpPath, self.path("meta.json"))
+
+    def create(self, states: List[Any], pi: Dict[Any, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        self.states = states
+        self.stateIndex = {state: i for i, state in enumerate(states)}
+        self.actionList = sorted({action for action in pi.values() if action is not None}, key=repr) if pi else []
+        self.writeStates()
+        self.values = np.lib.format.open_memmap(self.path("values.npy"), mode="w+", dtype=np.float64, shape=(len(states),))
+        self.policy = np.lib.format.open_memmap(self.path("policy.npy"), mode="w+", dtype=np.int32, shape=(len(states),))
+        self.policy[:] = -1
+
+    def writeStates(self):
+        tmpPath = self.path("states.pkl.tmp")
+        with open(tmpPath, "wb") as f:
+            pickle.dump((self.states, self.actionList), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpPath, self.path("states.pkl"))
+
+    def load(self, states) -> Tuple[Dict[Any, float], Dict[Any, Any], Dict[str, Any]]:
+        """Return (V, pi, meta) from the last snapshot; pi is None if the solver
+        did not save one.  Raises ValueError if the snapshot was taken on a
+        different state space than |states|."""
+        with open(self.path("meta.json")) as f:
+            meta = json.load(f)
+        with open(self.path("states.pkl"), "rb") as f:
+            self.states, self.actionList = pickle.load(f)
+        if len(self.states) != len(states) or any(state not in states for state in self.states):
+            raise ValueError(f"Checkpoint in {self.directory} was taken on a different MDP")
+        self.stateIndex = {state: i for i, state in enumerate(self.states)}
+        self.values = np.load(self.path("values.npy"), mmap_mode="r+")
+        self.policy = np.load(self.path("policy.npy"), mmap_mode="r+")
+        V = dict(zip(self.states, self.values.tolist()))
+        pi = None
+        if meta["hasPolicy"]:
+            pi = {state: self.actionList[a] if a >= 0 else None for state, a in zip(self.states, self.policy.tolist())}
+        return V, pi, meta
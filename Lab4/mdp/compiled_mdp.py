@@ -0,0 +1,813 @@
+import json, os, pickle
+import numpy as np
+from collections.abc import MutableMapping
+from typing import List, Tuple, Dict, Any
+from mdp import MDP
+
+
+# A reachable MDP flattened into integer-indexed NumPy arrays.
+#
+# States are numbered 0..numStates-1 and every (state, action) pair is a
+# "row".  The layout is a two-level CSR structure:
+#   -- rows of state s are stateRowPtr[s]:stateRowPtr[s + 1]
+#      (rowState[r] is the owning state, rowAction[r] indexes actionList)
+#   -- transitions of row r are rowPtr[r]:rowPtr[r + 1], stored as
+#      (nextState[t], prob[t], reward[t]); transRow[t] is the owning row.
+# Rows keep the order of mdp.actions(state) and transitions keep the order of
+# succAndProbReward, so reductions over them match the dict-based solvers.
+class CompiledMDP:
+    def __init__(self, states: List[Any], actionList: List[Any], stateRowPtr, rowAction, rowPtr, nextState, prob, reward, discount: float):
+        self.states = states
+        self._stateIndex = None
+        self.actionList = actionList
+        self.stateRowPtr = stateRowPtr
+        self.rowAction = rowAction
+        self.rowPtr = rowPtr
+        self.nextState = nextState
+        self.prob = prob
+        self.reward = reward
+        self.discount = discount
+
+        self.numStates = len(states)
+        self.numRows = len(rowAction)
+        self.numTransitions = len(nextState)
+        # Owner ids are only used for indexing and bincount, so int32 halves their memory when it fits.
+        ownerType = np.int32 if self.numRows < 2**31 else np.int64
+        self.rowState = np.repeat(np.arange(self.numStates, dtype=ownerType), np.diff(stateRowPtr))
+        self.transRow = np.repeat(np.arange(self.numRows, dtype=ownerType), np.diff(rowPtr))
+        # reduceat misbehaves on empty segments, so only reduce over states that have actions.
+        self.hasRows = np.diff(stateRowPtr) > 0
+        self.rowStarts = stateRowPtr[:-1][self.hasRows]
+
+    @property
+    def stateIndex(self) -> Dict[Any, int]:
+        # Built on first use: compiling millions of states through compileBatch
+        # should not pay for a dict nobody asks for.
+        if self._stateIndex is None:
+            self._stateIndex = {state: i for i, state in enumerate(self.states)}
+        return self._stateIndex
+
+    def statesAt(self, positions: np.ndarray) -> List[Any]:
+        """Return the states with the given state ids."""
+        if isinstance(self.states, IndexedStates):
+            return self.states[positions]
+        return [self.states[i] for i in positions.tolist()]
+
+    def computeQ(self, V: np.ndarray) -> np.ndarray:
+        """Return the Q value of every row given state values V."""
+        # prob * (reward + discount * V[next]), in place to keep one temporary.
+        # Values stored as float32 are widened, so the arithmetic stays float64.
+        contrib = V[self.nextState].astype(np.float64, copy=False)
+        contrib *= self.discount
+        contrib += self.reward
+        contrib *= self.prob
+        # bincount accumulates sequentially, matching MDPAlgorithm.computeQ bit for bit.
+        return np.bincount(self.transRow, weights=contrib, minlength=self.numRows)
+
+    def maxQ(self, Q: np.ndarray) -> np.ndarray:
+        """Return max_a Q(s, a) per state (0 for states without actions)."""
+        V = np.zeros(self.numStates)
+        if self.numRows:
+            V[self.hasRows] = np.maximum.reduceat(Q, self.rowStarts)
+        return V
+
+    def greedyRows(self, Q: np.ndarray, tol: float = 0.0) -> np.ndarray:
+        """Return the first row within |tol| of max_a Q(s, a) per state (-1 if none)."""
+        best = np.full(self.numStates, -1, dtype=np.int64)
+        if self.numRows:
+            V = self.maxQ(Q)
+            rows = np.arange(self.numRows, dtype=np.int64)
+            candidates = np.where(Q >= V[self.rowState] - tol, rows, self.numRows)
+            best[self.hasRows] = np.minimum.reduceat(candidates, self.rowStarts)
+        return best
+
+    def bellmanBackup(self, V: np.ndarray) -> np.ndarray:
+        """One synchronous Bellman optimality backup."""
+        return self.maxQ(self.computeQ(V))
+
+    def greedyPolicy(self, V: np.ndarray) -> np.ndarray:
+        """Return the greedy action index (into actionList) per state, -1 if none."""
+        rows = self.greedyRows(self.computeQ(V))
+        return np.where(rows >= 0, self.rowAction[np.maximum(rows, 0)], -1)
+
+    def firstRows(self) -> np.ndarray:
+        """Return the row of each state's first action (-1 if none)."""
+        return np.where(self.hasRows, self.stateRowPtr[:-1], -1)
+
+    def policyRows(self, pi: Dict[Any, Any]) -> np.ndarray:
+        """Return the row chosen by policy dict |pi| in each state, falling back
+        to the first action where pi has no (valid) entry."""
+        rows = self.firstRows()
+        for i, state in enumerate(self.states):
+            action = pi.get(state)
+            for row in range(self.stateRowPtr[i], self.stateRowPtr[i + 1]):
+                if self.actionList[self.rowAction[row]] == action:
+                    rows[i] = row
+                    break
+        return rows
+
+    def policyMatrix(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Return P_pi as CSR arrays (indptr, indices, data) plus the expected
+        one-step reward R_pi, for the policy choosing row rows[s] in state s.
+        States with rows[s] == -1 (no actions) get an empty row."""
+        valid = rows >= 0
+        safeRows = np.maximum(rows, 0)
+        counts = np.where(valid, self.rowPtr[safeRows + 1] - self.rowPtr[safeRows], 0)
+        indptr = np.zeros(self.numStates + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        # Flat transition ids: each state's block starts at rowPtr[row] and runs |counts| long.
+        offsets = np.arange(indptr[-1], dtype=np.int64) - np.repeat(indptr[:-1], counts)
+        trans = np.repeat(self.rowPtr[safeRows], counts) + offsets
+        owner = np.repeat(np.arange(self.numStates, dtype=np.int64), counts)
+        R = np.bincount(owner, weights=self.prob[trans] * self.reward[trans], minlength=self.numStates)
+        return indptr, self.nextState[trans], self.prob[trans], R
+
+    def evaluatePolicy(self, rows: np.ndarray, V0: np.ndarray = None, tol: float = 1e-10, denseLimit: int = 1024, maxSweeps: int = 100000) -> np.ndarray:
+        """Solve (I - gamma P_pi) V = R_pi exactly for the policy given by |rows|.
+
+        States without actions (e.g. Blackjack states whose deck is None) have an
+        empty P_pi row, so their equation is V[s] = 0 and the system stays
+        non-singular as long as the policy reaches them.  Small systems are
+        solved densely; larger ones use Jacobi-preconditioned BiCGSTAB, falling
+        back to at most |maxSweeps| fixed-point sweeps if the Krylov solver
+        stalls.  Raises ValueError if those do not converge either, as with
+        gamma = 1 and a policy that never reaches a state without actions.
+        """
+        indptr, indices, data, R = self.policyMatrix(rows)
+        n = self.numStates
+        owner = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+        gamma = self.discount
+
+        if n <= denseLimit:
+            A = np.eye(n)
+            np.add.at(A, (owner, indices), -gamma * data)
+            return np.linalg.solve(A, R)
+
+        def matvec(x):
+            return x - gamma * np.bincount(owner, weights=data * x[indices], minlength=n)
+
+        diag = 1.0 - gamma * np.bincount(owner, weights=np.where(indices == owner, data, 0.0), minlength=n)
+        x0 = np.zeros(n) if V0 is None else V0.astype(np.float64)
+        x, converged = bicgstab(matvec, R, x0, 1.0 / diag, tol)
+        for _ in range(maxSweeps):
+            if converged:
+                return x
+            x_new = R + gamma * np.bincount(owner, weights=data * x[indices], minlength=n)
+            converged = np.max(np.abs(x_new - x)) < tol
+            x = x_new
+        if not converged:
+            raise ValueError(f"Policy evaluation did not converge within {maxSweeps} sweeps; the policy may never terminate")
+        return x
+
+    def occupancy(self, rows: np.ndarray, start: int, discount: float = 1.0) -> Tuple[np.ndarray, np.ndarray]:
+        """Push probability mass 1 at state |start| forward through the policy
+        graph given by |rows|, in topological order (Kahn's algorithm, one
+        frontier of states at a time), so each transition is visited once.
+        Returns (visits, flow): the expected number of visits to every state
+        and the probability mass carried by every transition, each visit
+        weighted by discount^t at step t.  Transitions of rows the policy does
+        not choose carry no flow.  Raises ValueError if
+        the policy graph reachable from |start| has a cycle, where the
+        undiscounted visit counts need not be finite."""
+        valid = rows >= 0
+        safeRows = np.maximum(rows, 0)
+        counts = np.where(valid, self.rowPtr[safeRows + 1] - self.rowPtr[safeRows], 0)
+        chosen = np.zeros(self.numRows, dtype=bool)
+        chosen[rows[valid]] = True
+        chosenTrans = chosen[self.transRow]
+        inDegree = np.bincount(self.nextState[chosenTrans], minlength=self.numStates)
+
+        visits = np.zeros(self.numStates)
+        flow = np.zeros(self.numTransitions)
+        visits[start] = 1.0
+        done = np.zeros(self.numStates, dtype=bool)
+        frontier = np.flatnonzero(inDegree == 0)
+        while len(frontier):
+            done[frontier] = True
+            # Flat transition ids of the frontier's chosen rows.
+            frontierCounts = counts[frontier]
+            offsets = np.arange(frontierCounts.sum(), dtype=np.int64) - np.repeat(np.cumsum(frontierCounts) - frontierCounts, frontierCounts)
+            trans = np.repeat(self.rowPtr[safeRows[frontier]], frontierCounts) + offsets
+            flow[trans] = np.repeat(visits[frontier], frontierCounts) * self.prob[trans]
+            targets = self.nextState[trans]
+            visits += discount * np.bincount(targets, weights=flow[trans], minlength=self.numStates)
+            inDegree -= np.bincount(targets, minlength=self.numStates)
+            candidates = np.unique(targets)
+            frontier = candidates[inDegree[candidates] == 0]
+        if not np.all(done | (visits == 0)):
+            raise ValueError("The policy graph reachable from the start state has a cycle")
+        return visits, flow
+
+    def sumRows(self, X: np.ndarray) -> np.ndarray:
+        """Sum a (numTransitions, K) array over the transitions of each row."""
+        out = np.zeros((self.numRows,) + X.shape[1:])
+        nonEmpty = self.rowPtr[:-1] < self.rowPtr[1:]
+        if self.numTransitions:
+            out[nonEmpty] = np.add.reduceat(X, self.rowPtr[:-1][nonEmpty], axis=0)
+        return out
+
+    def rewardMatrix(self, mdps: List[MDP]) -> np.ndarray:
+        """Return the (numTransitions, K) rewards of K MDPs that share this
+        transition structure (same states, actions, successors and
+        probabilities; only rewards may differ).  Raises ValueError otherwise.
+        A structure compiled by compileBatch reads the rewards of MDPs with the
+        same array interface through transitionsBatch, one call per action."""
+        rewards = np.empty((self.numTransitions, len(mdps)))
+        if isinstance(self.states, IndexedStates) and all(mdp.batchActions() == self.actionList for mdp in mdps):
+            for k, mdp in enumerate(mdps):
+                rewards[:, k] = self.batchRewards(mdp, k)
+            return rewards
+        expectedActions = [self.actionList[a] for a in self.rowAction.tolist()]
+        for k, mdp in enumerate(mdps):
+            if mdp.startState() not in self.stateIndex:
+                raise ValueError(f"MDP {k} starts outside the compiled state space")
+            actions = []
+            nextState = []
+            prob = []
+            reward = []
+            for state in self.states:
+                for action in mdp.actions(state):
+                    actions.append(action)
+                    for newState, p, r in mdp.succAndProbReward(state, action):
+                        nextState.append(self.stateIndex.get(newState, -1))
+                        prob.append(p)
+                        reward.append(r)
+            if actions != expectedActions:
+                raise ValueError(f"MDP {k} has different actions")
+            if len(nextState) != self.numTransitions or not (np.array_equal(nextState, self.nextState) and np.array_equal(prob, self.prob)):
+                raise ValueError(f"MDP {k} has different transitions")
+            rewards[:, k] = reward
+        return rewards
+
+    def batchRewards(self, mdp: MDP, k: int) -> np.ndarray:
+        """Rewards of |mdp| in transition order, for a structure compiled by
+        compileBatch: state s has one row per action, row s * numActions + a."""
+        indices = self.states.indices
+        numActions = len(self.actionList)
+        reward = np.empty(self.numTransitions)
+        for a, action in enumerate(self.actionList):
+            counts, nextIndices, probs, rewards = mdp.transitionsBatch(indices, action)
+            rowStarts = self.rowPtr[a : self.numRows : numActions]
+            if not np.array_equal(counts, self.rowPtr[a + 1 : self.numRows + 1 : numActions] - rowStarts):
+                raise ValueError(f"MDP {k} has different transitions")
+            dest = np.repeat(rowStarts - (np.cumsum(counts) - counts), counts) + np.arange(len(nextIndices), dtype=np.int64)
+            if not (np.array_equal(self.states.indices[self.nextState[dest]], nextIndices) and np.array_equal(self.prob[dest], probs)):
+                raise ValueError(f"MDP {k} has different transitions")
+            reward[dest] = rewards
+        return reward
+
+    def computeQMany(self, V: np.ndarray, rowRewards: np.ndarray) -> np.ndarray:
+        """Q values for K value columns at once: V is (numStates, K) and
+        rowRewards the (numRows, K) expected immediate reward of each row.
+        The backup is one sparse (rows x states) times dense (states x K) product."""
+        return rowRewards + self.discount * self.sumRows(self.prob[:, None] * V[self.nextState])
+
+    def maxQMany(self, Q: np.ndarray) -> np.ndarray:
+        V = np.zeros((self.numStates, Q.shape[1]))
+        if self.numRows:
+            V[self.hasRows] = np.maximum.reduceat(Q, self.rowStarts, axis=0)
+        return V
+
+    def greedyPolicyMany(self, Q: np.ndarray) -> np.ndarray:
+        """First greedy action index per state and column, -1 where there is none."""
+        best = np.full((self.numStates, Q.shape[1]), -1, dtype=np.int64)
+        if self.numRows:
+            V = self.maxQMany(Q)
+            rows = np.arange(self.numRows, dtype=np.int64)[:, None]
+            candidates = np.where(Q >= V[self.rowState], rows, self.numRows)
+            best[self.hasRows] = self.rowAction[np.minimum.reduceat(candidates, self.rowStarts, axis=0)]
+        return best
+
+    # |states|, if given, is self.states already converted to a list, so that
+    # several dicts over the same states decode IndexedStates only once.
+    def valueDict(self, V: np.ndarray, states: List[Any] = None) -> Dict[Any, float]:
+        return dict(zip(self.states if states is None else states, V.tolist()))
+
+    def policyDict(self, actionIndices: np.ndarray, states: List[Any] = None) -> Dict[Any, Any]:
+        return {state: self.actionList[a] if a >= 0 else None for state, a in zip(self.states if states is None else states, actionIndices.tolist())}
+
+    def valueView(self, V: np.ndarray) -> "StateValues":
+        """Like valueDict, but keeps V as the array behind a dict-compatible view."""
+        return StateValues(self.states, V, self._stateIndex)
+
+
+# Dict-compatible view of per-state values kept in a flat array indexed by
+# state id (see MDPAlgorithm valueStorage).  Reads return Python floats and
+# iteration follows state id order; the set of states is fixed, so storing a
+# value for an unknown state raises KeyError.  The state -> id dict is only
+# built on the first lookup by state.
+class StateValues(MutableMapping):
+    def __init__(self, states, array: np.ndarray, stateIndex: Dict[Any, int] = None):
+        self.states = states
+        self.array = array
+        self._stateIndex = stateIndex
+
+    @property
+    def stateIndex(self) -> Dict[Any, int]:
+        if self._stateIndex is None:
+            self._stateIndex = {state: i for i, state in enumerate(self.states)}
+        return self._stateIndex
+
+    def __getitem__(self, state) -> float:
+        return float(self.array[self.stateIndex[state]])
+
+    def __setitem__(self, state, value: float):
+        self.array[self.stateIndex[state]] = value
+
+    def __delitem__(self, state):
+        raise TypeError("StateValues has a fixed set of states")
+
+    def __contains__(self, state) -> bool:
+        return state in self.stateIndex
+
+    def __iter__(self):
+        return iter(self.states)
+
+    def __len__(self) -> int:
+        return len(self.array)
+
+
+# A compiled MDP whose arrays live in files under |directory| instead of memory
+# (see compileToDisk).  The layout matches CompiledMDP, one raw file per array:
+#   -- stateRowPtr.bin, rowAction.bin, rowPtr.bin: int64 CSR pointers and action ids
+#   -- nextState.bin (int64), prob.bin and reward.bin (float64): one entry per transition
+#   -- states.pkl: the states (or codec codes) in index order; actions.pkl: actionList
+#   -- meta.json: array lengths and the discount
+# Arrays are read back in slices through short-lived memory maps, so only the
+# slice being processed counts towards resident memory.
+class DiskCompiledMDP:
+    DTYPES = {
+        "stateRowPtr": np.int64,
+        "rowAction": np.int64,
+        "rowPtr": np.int64,
+        "nextState": np.int64,
+        "prob": np.float64,
+        "reward": np.float64,
+    }
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(self.path("meta.json")) as f:
+            meta = json.load(f)
+        self.numStates = meta["numStates"]
+        self.numRows = meta["numRows"]
+        self.numTransitions = meta["numTransitions"]
+        self.discount = meta["discount"]
+        with open(self.path("actions.pkl"), "rb") as f:
+            self.actionList = pickle.load(f)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def read(self, name: str, start: int, stop: int) -> np.ndarray:
+        """Copy elements start:stop of array |name| into memory."""
+        dtype = np.dtype(self.DTYPES[name])
+        if stop <= start:
+            return np.empty(0, dtype=dtype)
+        view = np.memmap(self.path(name + ".bin"), dtype=dtype, mode="r", offset=start * dtype.itemsize, shape=(stop - start,))
+        chunk = np.array(view)
+        del view
+        return chunk
+
+    def states(self) -> List[Any]:
+        with open(self.path("states.pkl"), "rb") as f:
+            return pickle.load(f)
+
+    def chunks(self, maxTransitions: int) -> List[Tuple[int, int]]:
+        """Split the states into consecutive ranges [first, last) whose
+        transitions total at most |maxTransitions| (or a single state)."""
+        stateRowPtr = self.read("stateRowPtr", 0, self.numStates + 1)
+        rowPtr = np.memmap(self.path("rowPtr.bin"), dtype=np.int64, mode="r", shape=(self.numRows + 1,))
+        stateTransPtr = np.array(rowPtr[stateRowPtr])
+        del rowPtr, stateRowPtr
+        ranges = []
+        first = 0
+        while first < self.numStates:
+            last = int(np.searchsorted(stateTransPtr, stateTransPtr[first] + maxTransitions, side="right")) - 1
+            last = min(max(last, first + 1), self.numStates)
+            ranges.append((first, last))
+            first = last
+        return ranges
+
+    def chunkQ(self, V: np.ndarray, first: int, last: int) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Return the Q values of the rows of states first:last, their row
+        pointers relative to the first of those rows, and that row's index."""
+        stateRowPtr = self.read("stateRowPtr", first, last + 1)
+        rowPtr = self.read("rowPtr", stateRowPtr[0], stateRowPtr[-1] + 1)
+        start, stop = rowPtr[0], rowPtr[-1]
+        contrib = self.read("prob", start, stop) * (self.read("reward", start, stop) + self.discount * V[self.read("nextState", start, stop)])
+        transRow = np.repeat(np.arange(len(rowPtr) - 1, dtype=np.int64), np.diff(rowPtr))
+        # bincount accumulates sequentially, matching CompiledMDP.computeQ bit for bit.
+        Q = np.bincount(transRow, weights=contrib, minlength=len(rowPtr) - 1)
+        return Q, stateRowPtr - stateRowPtr[0], int(stateRowPtr[0])
+
+    def backupChunk(self, V: np.ndarray, first: int, last: int) -> np.ndarray:
+        """One Bellman optimality backup of states first:last."""
+        Q, stateRowPtr, rowOffset = self.chunkQ(V, first, last)
+        out = np.zeros(last - first)
+        hasRows = np.diff(stateRowPtr) > 0
+        if len(Q):
+            out[hasRows] = np.maximum.reduceat(Q, stateRowPtr[:-1][hasRows])
+        return out
+
+    def greedyChunk(self, V: np.ndarray, first: int, last: int) -> np.ndarray:
+        """Greedy action index (into actionList) of states first:last, -1 if none."""
+        Q, stateRowPtr, rowOffset = self.chunkQ(V, first, last)
+        best = np.full(last - first, -1, dtype=np.int64)
+        hasRows = np.diff(stateRowPtr) > 0
+        if len(Q):
+            rowStarts = stateRowPtr[:-1][hasRows]
+            rowState = np.repeat(np.arange(last - first, dtype=np.int64), np.diff(stateRowPtr))
+            maxQ = np.zeros(last - first)
+            maxQ[hasRows] = np.maximum.reduceat(Q, rowStarts)
+            rows = np.arange(len(Q), dtype=np.int64)
+            rows = np.minimum.reduceat(np.where(Q >= maxQ[rowState], rows, len(Q)), rowStarts)
+            best[hasRows] = self.read("rowAction", rowOffset, rowOffset + len(Q))[rows]
+        return best
+
+
+def residentMemory() -> int:
+    """Resident set size of this process in bytes.  Reads /proc on Linux and
+    falls back to the peak reported by getrusage elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def hashCombine(h: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """Mix the integers |x| into the 64-bit hashes |h| (splitmix64 finalizer;
+    uint64 arithmetic wraps around)."""
+    h = (h ^ x.astype(np.uint64)) + np.uint64(0x9E3779B97F4A7C15)
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def concatRanges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Concatenate the ranges starts[i]:starts[i] + counts[i]."""
+    offsets = np.arange(counts.sum(), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+def blockDistributions(compiled: CompiledMDP, blocks: np.ndarray, numBlocks: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Aggregate every row's transitions by the block of the next state.
+    Returns (row, block, prob) entries sorted by row, then block."""
+    keys, inverse = np.unique(compiled.transRow.astype(np.int64) * numBlocks + blocks[compiled.nextState], return_inverse=True)
+    return keys // numBlocks, keys % numBlocks, np.bincount(inverse.ravel(), weights=compiled.prob, minlength=len(keys))
+
+
+def bisimulationBlocks(compiled: CompiledMDP, tolerance: float = 1e-9) -> Tuple[np.ndarray, int]:
+    """Partition the states of |compiled| into bisimulation classes by
+    partition refinement.  Starting from a single block, every round splits
+    states whose rows differ in action, expected immediate reward or
+    probability of moving into each current block, until no block splits.
+    Rewards and probabilities are compared after rounding to multiples of
+    |tolerance|: the default only absorbs round-off, larger values merge
+    states that are merely close (approximate bisimulation).  Signatures are
+    compared through 64-bit hashes.  Returns (block of every state, number of blocks)."""
+    def quantize(x):
+        return np.round(x / tolerance).astype(np.int64)
+
+    rowReward = np.bincount(compiled.transRow, weights=compiled.prob * compiled.reward, minlength=compiled.numRows)
+    rowKey = hashCombine(hashCombine(np.zeros(compiled.numRows, dtype=np.uint64), compiled.rowAction), quantize(rowReward))
+    # Position of each row among its state's rows, so row order is part of the signature.
+    rowPosition = np.arange(compiled.numRows, dtype=np.int64) - compiled.stateRowPtr[compiled.rowState]
+    blocks = np.zeros(compiled.numStates, dtype=np.int64)
+    numBlocks = 1
+    while True:
+        entryRow, entryBlock, entryProb = blockDistributions(compiled, blocks, numBlocks)
+        rowHash = rowKey.copy()
+        if len(entryRow):
+            entryHash = hashCombine(hashCombine(np.zeros(len(entryRow), dtype=np.uint64), entryBlock), quantize(entryProb))
+            starts = np.flatnonzero(np.r_[True, entryRow[1:] != entryRow[:-1]])
+            # Summing entry hashes makes the row hash independent of entry order.
+            rowHash[entryRow[starts]] += np.add.reduceat(entryHash, starts)
+        rowHash = hashCombine(rowHash, rowPosition)
+        stateHash = hashCombine(np.zeros(compiled.numStates, dtype=np.uint64), blocks)
+        if compiled.numRows:
+            stateHash[compiled.hasRows] += np.add.reduceat(rowHash, compiled.rowStarts)
+        _, newBlocks = np.unique(stateHash, return_inverse=True)
+        newNumBlocks = int(newBlocks.max()) + 1 if compiled.numStates else 0
+        blocks = newBlocks.ravel().astype(np.int64)
+        if newNumBlocks == numBlocks:
+            return blocks, numBlocks
+        numBlocks = newNumBlocks
+
+
+def quotientMDP(compiled: CompiledMDP, blocks: np.ndarray, numBlocks: int) -> CompiledMDP:
+    """Build the MDP over blocks: block b takes the rows of its first state,
+    with transitions aggregated by target block and the row's expected reward
+    spread so that every row keeps its expected immediate reward."""
+    _, representatives = np.unique(blocks, return_index=True)
+    entryRow, entryBlock, entryProb = blockDistributions(compiled, blocks, numBlocks)
+    rowReward = np.bincount(compiled.transRow, weights=compiled.prob * compiled.reward, minlength=compiled.numRows)
+    rowProb = np.bincount(compiled.transRow, weights=compiled.prob, minlength=compiled.numRows)
+    entryRowPtr = np.searchsorted(entryRow, np.arange(compiled.numRows + 1))
+
+    rowCounts = compiled.stateRowPtr[representatives + 1] - compiled.stateRowPtr[representatives]
+    rows = concatRanges(compiled.stateRowPtr[representatives], rowCounts)
+    entryCounts = entryRowPtr[rows + 1] - entryRowPtr[rows]
+    entries = concatRanges(entryRowPtr[rows], entryCounts)
+    stateRowPtr = np.zeros(numBlocks + 1, dtype=np.int64)
+    np.cumsum(rowCounts, out=stateRowPtr[1:])
+    rowPtr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(entryCounts, out=rowPtr[1:])
+    entryOwner = np.repeat(rows, entryCounts)
+    return CompiledMDP(
+        list(range(numBlocks)),
+        compiled.actionList,
+        stateRowPtr,
+        compiled.rowAction[rows],
+        rowPtr,
+        entryBlock[entries],
+        entryProb[entries],
+        rowReward[entryOwner] / rowProb[entryOwner],
+        compiled.discount,
+    )
+
+
+def bicgstab(matvec, b: np.ndarray, x0: np.ndarray, invDiag: np.ndarray, tol: float, maxIters: int = 1000) -> Tuple[np.ndarray, bool]:
+    """Jacobi-preconditioned BiCGSTAB for A x = b.  Stops once the max-norm of
+    the residual drops below |tol|.  Returns (x, converged)."""
+    x = x0.copy()
+    r = b - matvec(x)
+    if np.max(np.abs(r), initial=0.0) < tol:
+        return x, True
+    rHat = r.copy()
+    rho = alpha = omega = 1.0
+    v = np.zeros_like(b)
+    p = np.zeros_like(b)
+    for _ in range(maxIters):
+        rhoNew = rHat @ r
+        if rhoNew == 0.0 or omega == 0.0:
+            break
+        beta = (rhoNew / rho) * (alpha / omega)
+        p = r + beta * (p - omega * v)
+        pHat = invDiag * p
+        v = matvec(pHat)
+        alpha = rhoNew / (rHat @ v)
+        s = r - alpha * v
+        x += alpha * pHat
+        if np.max(np.abs(s)) < tol:
+            return x, True
+        sHat = invDiag * s
+        t = matvec(sHat)
+        tt = t @ t
+        omega = (t @ s) / tt if tt > 0.0 else 0.0
+        x += omega * sHat
+        r = s - omega * t
+        if np.max(np.abs(r)) < tol:
+            return x, True
+        rho = rhoNew
+    return x, False
+
+
+def compileMDP(mdp: MDP) -> CompiledMDP:
+    """Enumerate the reachable states of |mdp| once and flatten its transitions.
+    MDPs with an array interface (see MDP.transitionsBatch) go through
+    compileBatch.  A state set shared with shareStates is reused on both paths;
+    compileBatch orders it by state index rather than by the shared index."""
+    if mdp.batchActions() is not None:
+        indices = None
+        if mdp.sharedStates is not None:
+            indices = np.unique(np.asarray(mdp.stateIndices(list(mdp.sharedStates)), dtype=np.int64))
+        return compileBatch(mdp, indices=indices)
+    mdp.computeStates()
+    stateIndex = getattr(mdp, "stateIndex", None)
+    if stateIndex is None:
+        stateIndex = {state: i for i, state in enumerate(mdp.states)}
+    states = list(stateIndex)
+    actionList = []
+    actionIndex = {}
+
+    stateRowPtr = [0]
+    rowAction = []
+    rowPtr = [0]
+    nextState = []
+    prob = []
+    reward = []
+    for state in states:
+        for action in mdp.actions(state):
+            if action not in actionIndex:
+                actionIndex[action] = len(actionList)
+                actionList.append(action)
+            rowAction.append(actionIndex[action])
+            for newState, p, r in mdp.succAndProbReward(state, action):
+                nextState.append(stateIndex[newState])
+                prob.append(p)
+                reward.append(r)
+            rowPtr.append(len(nextState))
+        stateRowPtr.append(len(rowAction))
+
+    return CompiledMDP(
+        states,
+        actionList,
+        np.array(stateRowPtr, dtype=np.int64),
+        np.array(rowAction, dtype=np.int64),
+        np.array(rowPtr, dtype=np.int64),
+        np.array(nextState, dtype=np.int64),
+        np.array(prob, dtype=np.float64),
+        np.array(reward, dtype=np.float64),
+        mdp.discount(),
+    )
+
+
+def reachableIndices(mdp: MDP) -> np.ndarray:
+    """Sorted indices reachable from mdp.startIndex(), found with a
+    breadth-first search over MDP.transitionsBatch, one level at a time."""
+    seen = np.array([mdp.startIndex()], dtype=np.int64)
+    frontier = seen
+    while len(frontier):
+        successors = np.unique(np.concatenate([mdp.transitionsBatch(frontier, action)[1] for action in mdp.batchActions()]))
+        frontier = successors[~np.isin(successors, seen, assume_unique=True)]
+        seen = np.union1d(seen, frontier)
+    return seen
+
+
+class IndexedStates:
+    """Read-only sequence of the states behind an array of MDP state indices,
+    converted through mdp.indexedStates on access (in blocks when iterated),
+    so a compiled MDP with millions of states does not keep them all as
+    Python objects."""
+
+    def __init__(self, mdp: MDP, indices: np.ndarray, blockSize: int = 1 << 16):
+        self.mdp = mdp
+        self.indices = indices
+        self.blockSize = blockSize
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, (slice, np.ndarray)):
+            return self.mdp.indexedStates(self.indices[i])
+        return self.mdp.indexedStates(self.indices[i : i + 1] if i >= 0 else self.indices[i:][:1])[0]
+
+    def __iter__(self):
+        for first in range(0, len(self.indices), self.blockSize):
+            yield from self.mdp.indexedStates(self.indices[first : first + self.blockSize])
+
+
+def compileBatch(mdp: MDP, chunkStates: int = 1 << 20, indices: np.ndarray = None) -> CompiledMDP:
+    """Compile an MDP through its array interface (see MDP.transitionsBatch)
+    without a per-state Python call.  States are the reachable indices in
+    increasing order (or the sorted |indices|, if already known), each with one
+    row per batchActions() entry (empty where the action has no transitions).  Transitions are generated |chunkStates|
+    states at a time, twice: once to count them and once to fill arrays of
+    the final size, so no chunk lists are concatenated.  Rows and transitions
+    keep the order of the per-state interface, so solvers produce the same
+    values as on compileMDP."""
+    actionList = list(mdp.batchActions())
+    numActions = len(actionList)
+    if indices is None:
+        indices = mdp.reachableIndices()
+    if indices is None:
+        indices = reachableIndices(mdp)
+    numStates = len(indices)
+    # Indices 0..n-1 are their own state ids, so no lookup is needed.
+    contiguous = numStates == 0 or (indices[0] == 0 and indices[-1] == numStates - 1)
+    chunks = [indices[first : first + chunkStates] for first in range(0, numStates, chunkStates)]
+
+    rowPtr = np.zeros(numStates * numActions + 1, dtype=np.int64)
+    for c, chunk in enumerate(chunks):
+        firstRow = c * chunkStates * numActions
+        counts = np.stack([mdp.transitionsBatch(chunk, action)[0] for action in actionList], axis=1).ravel()
+        rowPtr[firstRow + 1 : firstRow + 1 + len(counts)] = counts
+    np.cumsum(rowPtr, out=rowPtr)
+
+    indexType = np.int32 if numStates < 2**31 else np.int64
+    nextState = np.empty(rowPtr[-1], dtype=indexType)
+    prob = np.empty(rowPtr[-1])
+    reward = np.empty(rowPtr[-1])
+    for c, chunk in enumerate(chunks):
+        firstRow = c * chunkStates * numActions
+        for a, action in enumerate(actionList):
+            counts, nextIndices, probs, rewards = mdp.transitionsBatch(chunk, action)
+            # Transition j of this action lands in row s * numActions + a, after the row's earlier transitions.
+            starts = rowPtr[firstRow + a : firstRow + len(chunk) * numActions : numActions] - (np.cumsum(counts) - counts)
+            dest = np.repeat(starts, counts) + np.arange(len(nextIndices), dtype=np.int64)
+            nextState[dest] = nextIndices if contiguous else np.searchsorted(indices, nextIndices)
+            prob[dest] = probs
+            reward[dest] = rewards
+
+    return CompiledMDP(
+        IndexedStates(mdp, indices),
+        actionList,
+        np.arange(numStates + 1, dtype=np.int64) * numActions,
+        np.tile(np.arange(numActions, dtype=np.int16 if numActions < 2**15 else np.int64), numStates),
+        rowPtr,
+        nextState,
+        prob,
+        reward,
+        mdp.discount(),
+    )
+
+
+def compileCodec(codec) -> CompiledMDP:
+    """Compile an MDP through its state codec (see MDP.stateCodec).  States are
+    the reachable integer codes in breadth-first order; enumeration and
+    compilation share one pass, and no state tuples are materialized."""
+    codes = [codec.startCode()]
+    codeIndex = {codes[0]: 0}
+    actionList = list(codec.actionList)
+    rowPtr = [0]
+    nextState = []
+    prob = []
+    reward = []
+    i = 0
+    while i < len(codes):
+        code = codes[i]
+        i += 1
+        for action in actionList:
+            for newCode, p, r in codec.succAndProbReward(code, action):
+                j = codeIndex.get(newCode)
+                if j is None:
+                    j = codeIndex[newCode] = len(codes)
+                    codes.append(newCode)
+                nextState.append(j)
+                prob.append(p)
+                reward.append(r)
+            rowPtr.append(len(nextState))
+
+    return CompiledMDP(
+        codes,
+        actionList,
+        np.arange(len(codes) + 1, dtype=np.int64) * len(actionList),
+        np.tile(np.arange(len(actionList), dtype=np.int64), len(codes)),
+        np.array(rowPtr, dtype=np.int64),
+        np.array(nextState, dtype=np.int64),
+        np.array(prob, dtype=np.float64),
+        np.array(reward, dtype=np.float64),
+        codec.discount,
+    )
+
+
+def compileToDisk(source, directory: str, chunkTransitions: int = 1 << 20, onFlush=None) -> DiskCompiledMDP:
+    """Enumerate and compile |source|, an MDP or a state codec (see
+    MDP.stateCodec), straight into a DiskCompiledMDP in |directory|.  States
+    are numbered in breadth-first order and their rows written in that order,
+    flushing to disk every |chunkTransitions| transitions; only the state index
+    and the current chunk are held in memory.  |onFlush|, if given, is called
+    after each chunk is written."""
+    if isinstance(source, MDP):
+        start, actions, discount = source.startState(), source.actions, source.discount()
+    else:
+        start, actions, discount = source.startCode(), (lambda code: source.actionList), source.discount
+    os.makedirs(directory, exist_ok=True)
+    files = {name: open(os.path.join(directory, name + ".bin"), "wb") for name in DiskCompiledMDP.DTYPES}
+    buffers = {name: [] for name in DiskCompiledMDP.DTYPES}
+
+    def flush():
+        for name, values in buffers.items():
+            np.array(values, dtype=DiskCompiledMDP.DTYPES[name]).tofile(files[name])
+            values.clear()
+        if onFlush is not None:
+            onFlush()
+
+    states = [start]
+    stateIndex = {start: 0}
+    actionList = []
+    actionIndex = {}
+    numRows = numTransitions = 0
+    buffers["stateRowPtr"].append(0)
+    buffers["rowPtr"].append(0)
+    try:
+        i = 0
+        while i < len(states):
+            state = states[i]
+            i += 1
+            for action in actions(state):
+                if action not in actionIndex:
+                    actionIndex[action] = len(actionList)
+                    actionList.append(action)
+                buffers["rowAction"].append(actionIndex[action])
+                for newState, p, r in source.succAndProbReward(state, action):
+                    j = stateIndex.get(newState)
+                    if j is None:
+                        j = stateIndex[newState] = len(states)
+                        states.append(newState)
+                    buffers["nextState"].append(j)
+                    buffers["prob"].append(p)
+                    buffers["reward"].append(r)
+                    numTransitions += 1
+                numRows += 1
+                buffers["rowPtr"].append(numTransitions)
+            buffers["stateRowPtr"].append(numRows)
+            if len(buffers["nextState"]) >= chunkTransitions:
+                flush()
+        flush()
+    finally:
+        for f in files.values():
+            f.close()
+    del stateIndex
+    with open(os.path.join(directory, "states.pkl"), "wb") as f:
+        pickle.dump(states, f, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(directory, "actions.pkl"), "wb") as f:
+        pickle.dump(actionList, f, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump({"numStates": len(states), "numRows": numRows, "numTransitions": numTransitions, "discount": discount}, f)
+    return DiskCompiledMDP(directory)
@@ -1,6 +1,60 @@
 import argparse
+import collections
+import contextlib
+import csv
+import inspect
+import io
+import json
+import multiprocessing
+import time
 from mdp import NumberLineMDP, BlackjackMDP
-from mdp_algorithm import ValueIteration, PolicyIteration
+from simulation import BlackjackSimulator
+from analysis import analyzePolicy, blackjackOutcomes
+from result_cache import ResultCache
+from policy_table import PolicyTable
+from mdp_algorithm import (
+    ValueIteration,
+    PolicyIteration,
+    ModifiedPolicyIteration,
+    CompiledValueIteration,
+    OutOfCoreValueIteration,
+    BatchedValueIteration,
+    BisimulationValueIteration,
+    PrioritizedSweepingValueIteration,
+    TopologicalValueIteration,
+    LAOStar,
+)
+
+
+ALGORITHMS = {
+    "value_iteration": ValueIteration,
+    "policy_iteration": PolicyIteration,
+    "modified_policy_iteration": ModifiedPolicyIteration,
+    "compiled_value_iteration": CompiledValueIteration,
+    "out_of_core_value_iteration": OutOfCoreValueIteration,
+    "batched_value_iteration": BatchedValueIteration,
+    "bisimulation_value_iteration": BisimulationValueIteration,
+    "prioritized_sweeping": PrioritizedSweepingValueIteration,
+    "topological_value_iteration": TopologicalValueIteration,
+    "lao_star": LAOStar,
+}
+
+
+# Algorithms that accept an array valueStorage (see MDPAlgorithm).
+VALUE_STORAGE_ALGORITHMS = {name for name, cls in ALGORITHMS.items() if cls.ARRAY_VALUE_STORAGE}
+
+
+# create_mdp parameters that only change rewards, not which states are reachable.
+# Batch configurations that differ only in these share one state enumeration.
+REWARD_ONLY_PARAMS = {
+    "numberline": set(),
+    "blackjack": {"peek_cost"},
+}
+
+
+# Algorithm options that change how a solve runs but not its result; they are
+# left out of result cache keys.
+RESULT_NEUTRAL_OPTIONS = {"cacheTransitions", "maxCachedTransitions", "cacheEviction", "checkpoint", "checkpointEvery", "resume", "directory", "memoryLimit"}
 
 
 def create_mdp(mdp_type, **kwargs):
@@ -18,22 +72,169 @@ def create_mdp(mdp_type, **kwargs):
         raise ValueError(f"Unknown MDP type: {mdp_type}")
 
 
-def solve_mdp(mdp, algorithm_type):
-    """Solve the MDP using the specified algorithm."""
-    if algorithm_type in ["value_iteration", "policy_iteration"]:
+def default_epsilon(algorithm_type):
+    return inspect.signature(ALGORITHMS[algorithm_type].solve).parameters["epsilon"].default
+
+
+def solve_mdp(mdp, algorithm_type, epsilon=None, **algorithm_kwargs):
+    """Solve the MDP using the specified algorithm (with its default epsilon if None)."""
+    if algorithm_type in ALGORITHMS:
         # MDP-based algorithms
-        algorithm = ValueIteration() if algorithm_type == "value_iteration" else PolicyIteration()
-        algorithm.solve(mdp)
-        return algorithm.V, algorithm.pi
+        algorithm = ALGORITHMS[algorithm_type](**algorithm_kwargs)
+        if epsilon is None:
+            algorithm.solve(mdp)
+        else:
+            algorithm.solve(mdp, epsilon=epsilon)
+        return algorithm
     else:
         raise ValueError(f"Unknown algorithm type: {algorithm_type}")
 
 
+def write_trace_json(trace, path):
+    """Dump a solver trace (see MDPAlgorithm.trace) as JSON."""
+    with open(path, "w") as f:
+        json.dump(trace, f, indent=2)
+
+
+def write_trace_csv(trace, path):
+    """Dump a solver trace as CSV, one row per step; list-valued fields are dropped."""
+    steps = [{key: value for key, value in step.items() if not isinstance(value, (list, dict))} for step in trace["steps"]]
+    fields = []
+    for step in steps:
+        fields.extend(key for key in step if key not in fields)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["algorithm"] + fields)
+        writer.writeheader()
+        for step in steps:
+            writer.writerow({"algorithm": trace["algorithm"], **step})
+
+
+def print_trace(trace):
+    print("\nSolver Trace:")
+    print("-" * 50)
+    print(f"Transition calls (solver): {trace['transition_calls']}")
+    print(f"Transition calls (enumeration): {trace['enumeration_calls']}")
+    if trace["cache"] is not None:
+        print(f"Transition cache: {trace['cache']}")
+    for phase, seconds in trace["phase_times"].items():
+        print(f"  {phase:18} {seconds:.4f}s")
+    for step in trace["steps"]:
+        fields = ", ".join(f"{key}={value:.6g}" if isinstance(value, float) else f"{key}={value}" for key, value in step.items() if key != "iteration" and not isinstance(value, list))
+        print(f"Iteration {step['iteration']}: {fields}")
+
+
+def load_batch_spec(path):
+    """Read a batch spec and return the list of configurations.
+
+    The spec is a JSON object {"defaults": {...}, "configurations": [{...}, ...]}
+    (or just the list of configurations).  Each configuration holds "mdp",
+    "algorithm" and create_mdp parameters; defaults fill in missing keys.
+    """
+    with open(path) as f:
+        spec = json.load(f)
+    if isinstance(spec, list):
+        spec = {"configurations": spec}
+    defaults = spec.get("defaults", {})
+    configs = [{**defaults, **config} for config in spec["configurations"]]
+    for config in configs:
+        if "mdp" not in config or "algorithm" not in config:
+            raise ValueError(f"Batch configuration needs 'mdp' and 'algorithm': {config}")
+        if config["algorithm"] not in ALGORITHMS:
+            raise ValueError(f"Unknown algorithm type: {config['algorithm']}")
+    return configs
+
+
+def mdp_params(config):
+    return {key: value for key, value in config.items() if key not in ("mdp", "algorithm")}
+
+
+def structure_key(config):
+    """Configurations with equal keys have the same reachable state set."""
+    params = {key: value for key, value in mdp_params(config).items() if key not in REWARD_ONLY_PARAMS.get(config["mdp"], set())}
+    return json.dumps([config["mdp"], params], sort_keys=True)
+
+
+def enumerate_batch_group(config):
+    """Pool task: enumerate the states shared by one structure group."""
+    mdp = create_mdp(config["mdp"], **mdp_params(config))
+    start = time.perf_counter()
+    mdp.computeStates()
+    return mdp.states, time.perf_counter() - start
+
+
+def batch_result(config, mdp, V, pi, iterations, enumeration_time, solve_time, phase_times):
+    values = list(V.values())
+    return {
+        "config": config,
+        "states": len(V),
+        "iterations": iterations,
+        "enumeration_time": enumeration_time,
+        "solve_time": solve_time,
+        "phase_times": phase_times,
+        "start_value": V[mdp.startState()],
+        "start_action": pi.get(mdp.startState()),
+        "value_summary": {"min": min(values), "max": max(values), "mean": sum(values) / len(values)},
+        "policy_summary": dict(collections.Counter(str(action) for action in pi.values())),
+    }
+
+
+def solve_batch_configs(task):
+    """Pool task: solve configurations of one structure group on its
+    pre-enumerated states.  A task with several configurations holds reward
+    variants for batched_value_iteration, solved together by solveMany."""
+    configs, states, enumeration_time = task
+    mdps = [create_mdp(config["mdp"], **mdp_params(config)) for config in configs]
+    for mdp in mdps:
+        mdp.shareStates(states)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if len(configs) == 1:
+            algorithm = solve_mdp(mdps[0], configs[0]["algorithm"])
+            solutions = [(algorithm.V, algorithm.pi, algorithm.numIters)]
+        else:
+            algorithm = BatchedValueIteration()
+            algorithm.solveMany(mdps)
+            solutions = list(zip(algorithm.Vs, algorithm.pis, algorithm.numItersPerVariant))
+    # Batched variants share one solve, so each reports the whole solve's wall time.
+    solve_time = time.perf_counter() - start
+    phase_times = algorithm.trace()["phase_times"]
+    return [batch_result(config, mdp, V, pi, iterations, enumeration_time, solve_time, phase_times) for config, mdp, (V, pi, iterations) in zip(configs, mdps, solutions)]
+
+
+def run_batch(configs, processes=1):
+    """Solve every configuration across a process pool.  Each structure group is
+    enumerated once and its state set reused by all of its configurations;
+    batched_value_iteration configurations in a group are solved as one task."""
+    groups = collections.defaultdict(list)
+    for index, config in enumerate(configs):
+        groups[structure_key(config)].append(index)
+    representatives = [configs[members[0]] for members in groups.values()]
+    with multiprocessing.Pool(processes) as pool:
+        enumerated = pool.map(enumerate_batch_group, representatives)
+        task_indices = []
+        tasks = []
+        for (key, members), shared in zip(groups.items(), enumerated):
+            batched = [index for index in members if configs[index]["algorithm"] == "batched_value_iteration"]
+            single = [[index] for index in members if configs[index]["algorithm"] != "batched_value_iteration"]
+            for indices in single + ([batched] if batched else []):
+                task_indices.append(indices)
+                tasks.append(([configs[index] for index in indices], *shared))
+        results = [None] * len(configs)
+        for indices, task_results in zip(task_indices, pool.map(solve_batch_configs, tasks)):
+            for index, result in zip(indices, task_results):
+                results[index] = result
+    return results
+
+
 def main():
-    parser = argparse.ArgumentParser(description="Solve MDPs using different algorithms")
+    parser = argparse.ArgumentParser(
+        description="Solve MDPs using different algorithms",
+        epilog="Solved results are cached in --cache-dir and served again for the same MDP, algorithm and options. "
+        "Pass --no-cache to force a fresh solve, e.g. when timing solvers or after editing solver code.",
+    )
 
     # MDP selection
-    parser.add_argument("--mdp", choices=["numberline", "blackjack"], required=True, help="Type of MDP to solve")
+    parser.add_argument("--mdp", choices=["numberline", "blackjack"], help="Type of MDP to solve")
 
     # MDP parameters
     parser.add_argument("--n", type=int, default=5, help="Size parameter for NumberLineMDP")
@@ -43,9 +244,70 @@ def main():
     parser.add_argument("--peek-cost", type=int, default=1, help="Peek cost for BlackjackMDP")
 
     # Algorithm selection
-    parser.add_argument("--algorithm", choices=["value_iteration", "policy_iteration"], required=True, help="Algorithm to use")
+    parser.add_argument("--algorithm", choices=list(ALGORITHMS), help="Algorithm to use")
+    parser.add_argument("--epsilon", type=float, default=None, help="Convergence tolerance (default: the algorithm's own)")
+    parser.add_argument("--evaluation", choices=["sweeps", "linear"], default="sweeps", help="Policy evaluation mode for policy_iteration")
+    parser.add_argument("--eval-sweeps", type=int, default=5, help="Evaluation sweeps per improvement step (modified_policy_iteration)")
+    parser.add_argument("--eval-schedule", choices=["fixed", "adaptive"], default="fixed", help="How --eval-sweeps evolves across iterations (modified_policy_iteration)")
+    parser.add_argument("--eliminate-actions", action="store_true", help="Drop provably suboptimal actions using value bounds (value_iteration)")
+    parser.add_argument("--encode-states", action="store_true", help="Compile on compact integer state codes (compiled_value_iteration)")
+    parser.add_argument("--bisimulation-tolerance", type=float, default=1e-9, help="Rounding applied before comparing rewards and probabilities; larger values merge more states approximately (bisimulation_value_iteration)")
+    parser.add_argument("--transition-dir", default=None, help="Directory for the on-disk transitions (out_of_core_value_iteration; default: a temporary directory)")
+    parser.add_argument("--memory-limit", type=float, default=None, help="Target peak resident memory in MiB (out_of_core_value_iteration)")
+    parser.add_argument("--value-storage", choices=["dict", "float64", "float32"], default="dict", help="Keep V as a dict or as a flat float64/float32 array (value_iteration, policy_iteration, compiled_value_iteration, bisimulation_value_iteration)")
+    parser.add_argument("--trace", action="store_true", help="Print per-iteration residuals, phase timings and call counts")
+    parser.add_argument("--trace-json", default=None, help="Write the solver trace to this JSON file")
+    parser.add_argument("--trace-csv", default=None, help="Write the solver trace steps to this CSV file")
+    parser.add_argument("--checkpoint", default=None, help="Directory to snapshot V/pi into while solving (value_iteration, policy_iteration)")
+    parser.add_argument("--checkpoint-every", type=int, default=1, help="Iterations between checkpoint snapshots")
+    parser.add_argument("--resume", action="store_true", help="Resume from the snapshot in --checkpoint instead of starting from zero")
+    parser.add_argument("--cache-transitions", action="store_true", help="Memoize succAndProbReward across sweeps")
+    parser.add_argument("--max-cached-transitions", type=int, default=None, help="Cap on cached transitions (default: unbounded)")
+    parser.add_argument("--cache-eviction", choices=["lru", "mru"], default="mru", help="Eviction policy once the transition cache is full (lru never hits when the cap is below one sweep)")
+
+    # Result cache
+    parser.add_argument("--cache-dir", default=".mdp_cache", help="Directory of the on-disk cache of solved results")
+    parser.add_argument("--cache-size", type=float, default=256, help="Size bound of the result cache in MiB (least recently used results are evicted)")
+    parser.add_argument("--no-cache", action="store_true", help="Always solve, neither reading nor writing the result cache (use when timing solvers or after editing solver code)")
+
+    # Policy simulation
+    parser.add_argument("--simulate", type=int, default=None, help="Simulate this many episodes of the solved policy and compare with the exact start value (blackjack)")
+    parser.add_argument("--analyze", action="store_true", help="Compute the exact outcome distribution of the solved policy (acyclic MDPs such as blackjack)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for --simulate")
+    parser.add_argument("--export-policy", default=None, help="Write the solved policy to this file as a compact, memory-mappable lookup table")
+
+    # State-space enumeration
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes for --batch, or for a parallel --enumerate-only (slower than serial unless succAndProbReward is expensive)")
+    parser.add_argument("--enumerate-only", action="store_true", help="Only enumerate the state space and report its size per BFS level")
+
+    # Batch mode
+    parser.add_argument("--batch", default=None, help="JSON spec of configurations to solve in a process pool")
+    parser.add_argument("--batch-output", default="batch_results.json", help="Consolidated output file for --batch")
 
     args = parser.parse_args()
+    if args.batch is not None:
+        start_time = time.perf_counter()
+        results = run_batch(load_batch_spec(args.batch), args.processes)
+        with open(args.batch_output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Solved {len(results)} configurations in {time.perf_counter() - start_time:.3f}s; results in {args.batch_output}")
+        return
+    if args.mdp is None:
+        parser.error("--mdp is required unless --batch is given")
+    if args.algorithm is None and not args.enumerate_only:
+        parser.error("--algorithm is required unless --enumerate-only is given")
+    if args.simulate is not None and args.mdp != "blackjack":
+        parser.error("--simulate is only supported for --mdp blackjack")
+    if args.analyze and args.mdp == "numberline":
+        parser.error("--analyze needs an acyclic MDP, and numberline has cycles")
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume requires --checkpoint")
+    if args.checkpoint is not None and args.algorithm not in ["value_iteration", "policy_iteration"]:
+        parser.error("--checkpoint is only supported for value_iteration and policy_iteration")
+    if args.checkpoint is not None and args.algorithm == "policy_iteration" and args.evaluation != "sweeps":
+        parser.error("--checkpoint is only supported with --evaluation sweeps")
+    if args.value_storage != "dict" and args.algorithm is not None and args.algorithm not in VALUE_STORAGE_ALGORITHMS:
+        parser.error(f"--value-storage {args.value_storage} is only supported for {', '.join(sorted(VALUE_STORAGE_ALGORITHMS))}")
 
     # Create MDP
     mdp_kwargs = {
@@ -57,8 +319,67 @@ def main():
     }
     mdp = create_mdp(args.mdp, **mdp_kwargs)
 
+    if args.enumerate_only:
+        if args.processes > 1:
+            mdp.computeStatesParallel(args.processes, progress=lambda level, new, total: print(f"Level {level}: {new} new states, {total} total"))
+        else:
+            mdp.computeStates()
+        print(f"{len(mdp.states)} reachable states")
+        return
+
     # Solve MDP
-    result = solve_mdp(mdp, args.algorithm)
+    algorithm_kwargs = {}
+    if args.cache_transitions:
+        algorithm_kwargs["cacheTransitions"] = True
+        algorithm_kwargs["maxCachedTransitions"] = args.max_cached_transitions
+        algorithm_kwargs["cacheEviction"] = args.cache_eviction
+    if args.checkpoint is not None:
+        algorithm_kwargs["checkpoint"] = args.checkpoint
+        algorithm_kwargs["checkpointEvery"] = args.checkpoint_every
+        algorithm_kwargs["resume"] = args.resume
+    if args.algorithm == "policy_iteration":
+        algorithm_kwargs["evaluation"] = args.evaluation
+    if args.algorithm == "modified_policy_iteration":
+        algorithm_kwargs["evalSweeps"] = args.eval_sweeps
+        algorithm_kwargs["schedule"] = args.eval_schedule
+    if args.value_storage != "dict":
+        algorithm_kwargs["valueStorage"] = args.value_storage
+    if args.algorithm == "value_iteration":
+        algorithm_kwargs["eliminateActions"] = args.eliminate_actions
+    if args.algorithm == "compiled_value_iteration":
+        algorithm_kwargs["encodeStates"] = args.encode_states
+    if args.algorithm == "bisimulation_value_iteration":
+        algorithm_kwargs["tolerance"] = args.bisimulation_tolerance
+    if args.algorithm == "out_of_core_value_iteration":
+        algorithm_kwargs["directory"] = args.transition_dir
+        algorithm_kwargs["memoryLimit"] = int(args.memory_limit * 2**20) if args.memory_limit is not None else None
+    start_time = time.perf_counter()
+    algorithm = None
+    cache_key = None
+    # A checkpointed run is asked to go through the solver, so it bypasses the cache.
+    if not args.no_cache and args.checkpoint is None:
+        cache = ResultCache(args.cache_dir, int(args.cache_size * 2**20))
+        options = {key: value for key, value in algorithm_kwargs.items() if key not in RESULT_NEUTRAL_OPTIONS}
+        epsilon = args.epsilon if args.epsilon is not None else default_epsilon(args.algorithm)
+        cache_key = cache.key(mdp, args.algorithm, options, epsilon)
+        cached = cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            algorithm = ALGORITHMS[args.algorithm](**algorithm_kwargs)
+            algorithm.V, algorithm.pi, meta = cached
+            algorithm.numIters = meta["iterations"]
+            print(f"Loaded cached result {cache_key[:12]} from {args.cache_dir} (--no-cache to solve again)")
+    if algorithm is None:
+        algorithm = solve_mdp(mdp, args.algorithm, args.epsilon, **algorithm_kwargs)
+        if cache_key is not None:
+            cache.put(cache_key, algorithm.V, algorithm.pi, {"iterations": algorithm.numIters})
+    print(f"Solve time: {time.perf_counter() - start_time:.3f}s")
+    trace = algorithm.trace()
+    if args.trace:
+        print_trace(trace)
+    if args.trace_json:
+        write_trace_json(trace, args.trace_json)
+    if args.trace_csv:
+        write_trace_csv(trace, args.trace_csv)
 
     # Print results
     def print_summary(title, values, actions=None, max_states=3):
@@ -83,19 +404,19 @@ def main():
                 action_str = f", Action: {actions[state]}" if actions else ""
                 print(f"State: {state}{value_str}{action_str}")
 
-    if args.algorithm in ["value_iteration", "policy_iteration"]:
-        V, pi = result
+    if args.algorithm in ALGORITHMS:
+        V, pi = algorithm.V, algorithm.pi
         print(f"\n{args.algorithm.title()}: Solution Summary")
         print("-" * 50)
-        if args.algorithm == "policy_iteration" and hasattr(result[0], "steps"):
+        if args.algorithm in ["policy_iteration", "modified_policy_iteration"] and algorithm.steps:
             print("Policy Evaluation/Improvement Steps:")
-            for step in result[0].steps:
+            for step in algorithm.steps:
                 print(f"Iteration {step['iteration']}:")
                 print(f"  Policy evaluation iterations: {step['eval_iters']}")
                 print(f"  Max value change: {step['max_value_change']:.6f}")
                 print(f"  Policy changes: {step['policy_changes']}")
-        if hasattr(result[0], "numIters"):
-            print(f"Final number of iterations: {result[0].numIters}")
+        if hasattr(algorithm, "numIters"):
+            print(f"Final number of iterations: {algorithm.numIters}")
         print("\nVerification - Showing all states:")
         # Filter out None states and sort
         states = [s for s in V.keys() if s is not None]
@@ -127,6 +448,43 @@ def main():
                 action = pi[state] if state in pi else None
                 print(f"State: {str(state):20} | Value: {V[state]:.2f}    | Action: {action}")
 
+    if args.analyze:
+        start_time = time.perf_counter()
+        analysis = analyzePolicy(mdp, algorithm.pi)
+        print(f"\nPolicy Analysis ({time.perf_counter() - start_time:.3f}s)")
+        print("-" * 50)
+        print(f"Expected return: {analysis['expected_return']:.4f} over {len(analysis['visitation'])} visited states")
+        print("Expected action counts: " + ", ".join(f"{action}: {count:.4f}" for action, count in analysis["action_counts"].items()))
+        if isinstance(mdp, BlackjackMDP):
+            outcomes = blackjackOutcomes(mdp, analysis)
+            print(f"Bust probability: {outcomes['bust_probability']:.4f}")
+            print("Final total distribution:")
+            for total, probability in outcomes["final_totals"].items():
+                print(f"  {total}: {probability:.4f}")
+        else:
+            print("Final reward distribution:")
+            for reward, probability in analysis["terminal_rewards"].items():
+                print(f"  {reward:g}: {probability:.4f}")
+
+    if args.export_policy:
+        table = PolicyTable.fromPolicy(mdp, algorithm.pi)
+        table.save(args.export_policy)
+        print(f"\nExported policy for {len(table)} states to {args.export_policy}")
+
+    if args.simulate is not None:
+        start_time = time.perf_counter()
+        result = BlackjackSimulator(mdp, algorithm.pi).simulate(args.simulate, seed=args.seed)
+        elapsed = time.perf_counter() - start_time
+        exact = algorithm.V[mdp.startState()]
+        print(f"\nSimulation: {result['episodes']} episodes in {elapsed:.3f}s")
+        print("-" * 50)
+        print(f"Mean return: {result['mean']:.4f} (std {result['std']:.4f}, stderr {result['stderr']:.4f})")
+        print(f"{result['confidence']:.0%} confidence interval: [{result['ci_low']:.4f}, {result['ci_high']:.4f}]")
+        print(f"Exact start value: {exact:.4f} ({'inside' if result['ci_low'] <= exact <= result['ci_high'] else 'outside'} the interval)")
+        print("Return distribution:")
+        for value, probability in result["distribution"].items():
+            print(f"  {value:g}: {probability:.4f}")
+
 
 if __name__ == "__main__":
     main()
@@ -1,23 +1,364 @@
-import collections, random
+import collections, contextlib, heapq, itertools, random, shutil, tempfile, time
+import numpy as np
 from typing import List, Tuple, Dict, Any
 from mdp import MDP
+from compiled_mdp import CompiledMDP, StateValues, compileMDP, compileCodec, compileToDisk, residentMemory, bisimulationBlocks, quotientMDP
+from checkpoint import SolverCheckpoint
+
+
+# Memoizes mdp.succAndProbReward(state, action) across solver sweeps.
+# Capacity is counted in cached transitions (an empty successor list counts as
+# one), which is what dominates memory.  When full, entries are evicted with
+#   -- "mru" (default): most recently used first.  A new entry is the most
+#      recently used one, so a full cache simply stops inserting.  Solvers
+#      sweep the states in the same order every time, so the entries cached
+#      first stay hot when the cap is smaller than one sweep.
+#   -- "lru": least recently used first.  Under a cap smaller than one sweep
+#      every entry is evicted just before it is needed again, so it never hits.
+# A cap that covers a full sweep never evicts, so the policy does not matter there.
+class TransitionCache:
+    EVICTION_POLICIES = ("lru", "mru")
+
+    def __init__(self, maxTransitions: int = None, evictionPolicy: str = "mru"):
+        if evictionPolicy not in self.EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy: {evictionPolicy}")
+        self.maxTransitions = maxTransitions
+        self.evictionPolicy = evictionPolicy
+        self.mdp = None
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def isFull(self) -> bool:
+        return self.maxTransitions is not None and self.size >= self.maxTransitions
+
+    def get(self, mdp: MDP, state: Tuple, action: Any) -> Tuple:
+        if mdp is not self.mdp:
+            self.clear()
+            self.mdp = mdp
+        key = (state, action)
+        successors = self.entries.get(key)
+        if successors is not None:
+            self.hits += 1
+            # Only LRU needs the recency order; MRU never evicts a cached entry.
+            if self.maxTransitions is not None and self.evictionPolicy == "lru":
+                self.entries.move_to_end(key)
+            return successors
+        self.misses += 1
+        successors = mdp.succAndProbReward(state, action)
+        if self.evictionPolicy == "mru" and self.isFull():
+            self.evictions += 1
+            return successors
+        successors = tuple(successors)
+        self.put(key, successors)
+        return successors
+
+    def put(self, key: Tuple, successors: Tuple):
+        cost = max(len(successors), 1)
+        if self.maxTransitions is not None and cost > self.maxTransitions:
+            return
+        if self.evictionPolicy == "mru" and self.maxTransitions is not None and self.size + cost > self.maxTransitions:
+            # The new entry would be the most recently used, so it is the one dropped.
+            self.evictions += 1
+            return
+        while self.maxTransitions is not None and self.size + cost > self.maxTransitions:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= max(len(evicted), 1)
+            self.evictions += 1
+        self.entries[key] = successors
+        self.size += cost
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "transitions": self.size,
+        }
 
 
 # An algorithm that solves an MDP (i.e., computes the optimal
 # policy).
 class MDPAlgorithm:
-    """Base class for MDP solving algorithms."""
+    """Base class for MDP solving algorithms.
+
+    cacheTransitions turns on a TransitionCache so each succAndProbReward
+    result is computed once and reused by every sweep; maxCachedTransitions
+    and cacheEviction bound its memory (see TransitionCache).
+
+    Solvers record a trace while they run: self.steps holds one dict per
+    iteration (residuals, sweep counts, policy changes, wall time),
+    self.phaseTimes accumulates seconds per phase, and
+    self.numTransitionCalls counts solver-side succAndProbReward calls.
+    trace() bundles them for printing or dumping.
+
+    checkpoint is a directory; ValueIteration and PolicyIteration (sweeps)
+    snapshot V, pi and numIters there every checkpointEvery iterations, and
+    with resume they restart from the last snapshot (see SolverCheckpoint).
+
+    trackSuccessors makes enumeration record the MDP's successor graph, so a
+    later resolve() from this solution does not walk the previous MDP again.
+
+    valueStorage chooses how V is kept:
+    - "dict": a dict from state to Python float
+    - "float64" / "float32": a flat array indexed by compiled state id,
+      exposed as self.V through a dict-compatible StateValues view.
+      ValueIteration and PolicyIteration then sweep the compiled MDP instead
+      of calling computeQ (see solveArray); CompiledValueIteration,
+      BisimulationValueIteration and linear policy iteration keep their
+      arrays instead of building a dict at the end.  The other solvers
+      raise ValueError for the array storages.
+    float32 halves the array but keeps about 7 significant digits: every
+    stored value is rounded to within 6e-8 of its magnitude (backups still
+    compute in float64).  Rounding errors add up over the effective horizon
+    (1 / (1 - gamma), or the episode length for undiscounted acyclic MDPs
+    such as BlackjackMDP), so V may differ from float64 by a small multiple
+    of 1e-7 * max|V| times that horizon, and actions whose Q values differ by
+    less than that can be chosen differently.  Because changes below the
+    float32 resolution cannot be observed, convergence is tested against at
+    least a few float32 ulps of max|V| (see valueTolerance).
+    """
 
-    def __init__(self):
+    VALUE_TYPES = {"dict": None, "float64": np.float64, "float32": np.float32}
+    # Whether the solver honors the array value storages; the others reject them.
+    ARRAY_VALUE_STORAGE = False
+
+    def __init__(self, cacheTransitions=False, maxCachedTransitions=None, cacheEviction="mru", checkpoint=None, checkpointEvery=1, resume=False, valueStorage="dict", trackSuccessors=False):
+        if valueStorage not in self.VALUE_TYPES:
+            raise ValueError(f"Unknown value storage: {valueStorage}")
+        if valueStorage != "dict" and not self.ARRAY_VALUE_STORAGE:
+            raise ValueError(f"{type(self).__name__} only supports dict value storage")
+        if valueStorage != "dict" and checkpoint is not None:
+            raise ValueError("Checkpoints are only supported with dict value storage")
+        self.valueStorage = valueStorage
+        self.valueType = self.VALUE_TYPES[valueStorage]
         self.V = None  # Values for all states
         self.pi = None  # Policy for all states
         self.numIters = 0
         self.steps = []  # Track evaluation/improvement steps
+        self.transitionCache = TransitionCache(maxCachedTransitions, cacheEviction) if cacheTransitions else None
+        self.checkpoint = SolverCheckpoint(checkpoint) if checkpoint is not None else None
+        self.checkpointEvery = checkpointEvery
+        self.resume = resume
+        self.trackSuccessors = trackSuccessors
+        self.warmV = None
+        self.warmPi = None
+        self.resetTrace()
+
+    def warmStart(self, V: Dict[Tuple, float] = None, pi: Dict[Tuple, Any] = None):
+        """Start the next solves from V (and pi, for policy iteration) instead of
+        zero values and first actions.  States missing from them start at the defaults."""
+        self.warmV = V
+        self.warmPi = pi
+
+    def initialValues(self, mdp: MDP) -> Dict[Tuple, float]:
+        if self.warmV is None:
+            return {state: 0 for state in mdp.states}
+        return {state: self.warmV.get(state, 0) for state in mdp.states}
+
+    def initialValueArray(self, compiled: CompiledMDP) -> np.ndarray:
+        if self.warmV is None:
+            return np.zeros(compiled.numStates)
+        return np.array([self.warmV.get(state, 0) for state in compiled.states], dtype=np.float64)
+
+    def storedValues(self, V: np.ndarray) -> np.ndarray:
+        """V rounded to the configured storage type (float64 under dict storage)."""
+        return V.astype(self.valueType or np.float64, copy=False)
+
+    def valueTolerance(self, V: np.ndarray, epsilon: float) -> float:
+        """Convergence threshold for values stored in V: epsilon, raised under
+        float32 storage to 8 ulps of max|V| so rounding noise cannot keep a
+        solver from converging."""
+        if V.dtype != np.float32:
+            return epsilon
+        return max(epsilon, 8 * float(np.finfo(np.float32).eps) * float(np.max(np.abs(V), initial=0.0)))
+
+    def valueResult(self, compiled: CompiledMDP, V: np.ndarray):
+        """self.V for values V over the compiled states, in the configured storage."""
+        if self.valueType is None:
+            return compiled.valueDict(V)
+        return compiled.valueView(V.astype(self.valueType, copy=False))
+
+    def initialPolicy(self, mdp: MDP) -> Dict[Tuple, Any]:
+        pi = {}
+        for state in mdp.states:
+            actions = mdp.actions(state)
+            previous = self.warmPi.get(state) if self.warmPi is not None else None
+            pi[state] = previous if previous in actions else (actions[0] if actions else None)
+        return pi
+
+    def resolve(self, mdp: MDP, previousMdp: MDP, V: Dict[Tuple, float], pi: Dict[Tuple, Any] = None, epsilon=0.001):
+        """Re-solve |mdp| after a parameter change, starting from the solution
+        (V, pi) of |previousMdp|.  States are enumerated with
+        computeStatesIncremental against the successor graph of previousMdp
+        (recorded when it was solved with trackSuccessors, or else walked here
+        first), so only states whose successors changed are expanded again.  Values can only change on those states, states whose
+        rewards changed (mdp.rewardsChanged) and their ancestors; every other
+        state keeps its value and action from (V, pi), and the affected states
+        are re-converged by topological sweeps (see TopologicalValueIteration).
+        Sets self.numExpandedStates, self.numAffectedStates and self.numIters
+        (state backups)."""
+        self.resetTrace()
+        self.numIters = 0
+        with self.timePhase("incremental_enumeration"):
+            if previousMdp.successorGraph is None:
+                # Solved without trackSuccessors, or without walking the graph
+                # at all (e.g. compiled by compileBatch).
+                previousMdp.computeStatesIncremental()
+            self.numExpandedStates = mdp.computeStatesIncremental(previousMdp)
+        graph = mdp.successorGraph
+        with self.timePhase("decomposition"):
+            changed = mdp.expandedStates | {state for state in mdp.states if state not in V or mdp.rewardsChanged(state, previousMdp)}
+            parents = collections.defaultdict(list)
+            if changed:
+                for state, successors in graph.items():
+                    for newState in successors:
+                        parents[newState].append(state)
+            affected = set(changed)
+            queue = list(changed)
+            while queue:
+                for parent in parents[queue.pop()]:
+                    if parent not in affected:
+                        affected.add(parent)
+                        queue.append(parent)
+            successors = {state: [newState for newState in graph[state] if newState in affected] for state in affected}
+            components = stronglyConnectedComponents(affected, successors)
+        self.numAffectedStates = len(affected)
+
+        self.V = {state: V.get(state, 0) for state in mdp.states}
+
+        def backup(state):
+            actions = mdp.actions(state)
+            new_v = max(self.computeQ(mdp, self.V, state, action) for action in actions) if actions else 0
+            change = abs(new_v - self.V[state])
+            self.V[state] = new_v
+            self.numIters += 1
+            return change
+
+        with self.timePhase("backup"):
+            for component in components:
+                state = component[0]
+                if len(component) == 1 and state not in successors[state]:
+                    backup(state)
+                    continue
+                sweeps = 0
+                while True:
+                    delta = 0
+                    for state in component:
+                        delta = max(delta, backup(state))
+                    sweeps += 1
+                    if delta < epsilon:
+                        break
+                self.steps.append({"iteration": len(self.steps) + 1, "component_size": len(component), "eval_iters": sweeps, "max_value_change": delta})
+
+        with self.timePhase("policy_extraction"):
+            if pi is None:
+                self.pi = self.computeOptimalPolicy(mdp, self.V)
+            else:
+                self.pi = {}
+                for state in mdp.states:
+                    actions = mdp.actions(state)
+                    if state in affected or state not in pi:
+                        self.pi[state] = max(actions, key=lambda a: self.computeQ(mdp, self.V, state, a)) if actions else None
+                    else:
+                        self.pi[state] = pi[state]
+
+    def restoreCheckpoint(self, mdp: MDP) -> bool:
+        """Load self.V, self.pi and self.numIters from the checkpoint if resuming.
+        Returns True if the snapshot is of a finished solve, whose V and pi are
+        final, so the caller returns without running another iteration."""
+        if self.checkpoint is None or not self.resume or not self.checkpoint.exists():
+            return False
+        with self.timePhase("checkpoint"):
+            V, pi, meta = self.checkpoint.load(mdp.states)
+        self.V = V
+        if pi is not None:
+            self.pi = pi
+        self.numIters = meta["iteration"]
+        if meta.get("complete", False):
+            if pi is None:
+                with self.timePhase("policy_extraction"):
+                    self.pi = self.computeOptimalPolicy(mdp, self.V)
+            print(f"{type(self).__name__}: restored the finished solve ({self.numIters} iterations)")
+            return True
+        print(f"{type(self).__name__}: resumed from iteration {self.numIters}")
+        return False
+
+    def saveCheckpoint(self, mdp: MDP, complete=False):
+        """Snapshot the current solve every checkpointEvery iterations (always when complete)."""
+        if self.checkpoint is None or (not complete and self.numIters % self.checkpointEvery != 0):
+            return
+        with self.timePhase("checkpoint"):
+            self.checkpoint.save(type(self).__name__, mdp.states, self.V, self.pi, self.numIters, complete)
+
+    def resetTrace(self):
+        self.steps = []
+        self.phaseTimes = collections.defaultdict(float)
+        self.numTransitionCalls = 0
+        self.numEnumerationCalls = 0
+
+    @contextlib.contextmanager
+    def timePhase(self, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phaseTimes[phase] += time.perf_counter() - start
+
+    def enumerateStates(self, mdp: MDP, **kwargs):
+        """mdp.computeStates plus cache prefill, timed and counted."""
+        with self.timePhase("enumeration"):
+            mdp.computeStates(trackSuccessors=self.trackSuccessors, **kwargs)
+        # computeStates expands every reachable state once per action.
+        self.numEnumerationCalls = sum(len(mdp.actions(state)) for state in mdp.states)
+        with self.timePhase("cache_fill"):
+            self.cacheTransitions(mdp)
+
+    def trace(self) -> Dict[str, Any]:
+        """Return the structured trace of the last solve."""
+        cache = self.transitionCache
+        return {
+            "algorithm": type(self).__name__,
+            "iterations": self.numIters,
+            "phase_times": dict(self.phaseTimes),
+            "transition_calls": self.numTransitionCalls + (cache.misses if cache is not None else 0),
+            "enumeration_calls": self.numEnumerationCalls,
+            "cache": cache.stats() if cache is not None else None,
+            "steps": self.steps,
+        }
+
+    def cacheTransitions(self, mdp: MDP):
+        """Materialize successor lists for mdp.states right after computeStates,
+        stopping once the cache is full.  No-op when caching is off."""
+        cache = self.transitionCache
+        if cache is None:
+            return
+        cache.clear()
+        cache.mdp = mdp
+        for state in mdp.states:
+            for action in mdp.actions(state):
+                if cache.isFull():
+                    return
+                cache.put((state, action), tuple(mdp.succAndProbReward(state, action)))
+                self.numTransitionCalls += 1
 
     def computeQ(self, mdp: MDP, V: Dict[Tuple, float], state: Tuple, action: Any) -> float:
         q_value = 0.0
-        for next_state, prob, reward in mdp.succAndProbReward(state, action):
-            q_value += prob * (reward + mdp.discount() * V[next_state])
+        gamma = mdp.discount()
+        if self.transitionCache is None:
+            successors = mdp.succAndProbReward(state, action)
+            self.numTransitionCalls += 1
+        else:
+            successors = self.transitionCache.get(mdp, state, action)
+        for next_state, prob, reward in successors:
+            q_value += prob * (reward + gamma * V[next_state])
         return q_value
 
     def computeOptimalPolicy(self, mdp: MDP, V: Dict[Tuple, float]) -> Dict[Tuple, Any]:
@@ -45,15 +386,41 @@ class ValueIteration(MDPAlgorithm):
     Note: epsilon is the error tolerance: you should stop value iteration when
     all of the values change by less than epsilon.
     The ValueIteration class is a subclass of MDPAlgorithm.
+
+    With eliminateActions, every sweep also iterates an upper and a lower bound
+    on each state's value, starting from mdp.valueUpperBound and
+    mdp.valueLowerBound, and permanently drops an action once its Q value under
+    the upper bound falls below the best Q value under the lower bound: such an
+    action cannot be optimal.  Later sweeps and policy extraction only evaluate
+    the remaining actions.  self.numEliminated counts the dropped
+    (state, action) pairs.
     """
 
+    ARRAY_VALUE_STORAGE = True
+
+    def __init__(self, eliminateActions=False, **kwargs):
+        super().__init__(**kwargs)
+        if eliminateActions and self.valueType is not None:
+            raise ValueError("Action elimination is only supported with dict value storage")
+        self.eliminateActions = eliminateActions
+        self.numEliminated = 0
+
     def solve(self, mdp: MDP, epsilon=0.001):
         # Initialize
-        mdp.computeStates()
-        self.V = {state: 0 for state in mdp.states}
+        self.resetTrace()
+        if self.valueType is not None:
+            return self.solveArray(mdp, epsilon)
+        self.enumerateStates(mdp)
+        self.V = self.initialValues(mdp)
+        self.pi = None
         self.numIters = 0
+        if self.restoreCheckpoint(mdp):
+            return
+        if self.eliminateActions:
+            return self.solveEliminating(mdp, epsilon)
         # BEGIN_YOUR_CODE
         while True:
+            start = time.perf_counter()
             delta = 0
             new_V = {}
             for state in mdp.states:
@@ -66,30 +433,152 @@ class ValueIteration(MDPAlgorithm):
                 delta = max(delta, abs(new_V[state] - self.V[state]))
             self.V = new_V
             self.numIters += 1
+            elapsed = time.perf_counter() - start
+            self.phaseTimes["backup"] += elapsed
+            self.steps.append({"iteration": self.numIters, "max_value_change": delta, "bellman_residual": delta, "time": elapsed})
             if delta < epsilon:
                 break
+            self.saveCheckpoint(mdp)
         # END_YOUR_CODE
 
         # Compute optimal policy
-        self.pi = self.computeOptimalPolicy(mdp, self.V)
+        with self.timePhase("policy_extraction"):
+            self.pi = self.computeOptimalPolicy(mdp, self.V)
+        self.saveCheckpoint(mdp, complete=True)
         print(f"ValueIteration: {self.numIters} iterations")
 
+    def solveArray(self, mdp: MDP, epsilon=0.001):
+        """Value iteration over the compiled MDP with V in a flat array (see
+        valueStorage).  With float64 values every sweep computes exactly the
+        values of a solve() sweep."""
+        with self.timePhase("enumeration"):
+            self.compiled = compileMDP(mdp)
+        self.numTransitionCalls = self.compiled.numRows
+        V = self.storedValues(self.initialValueArray(self.compiled))
+        self.pi = None
+        self.numIters = 0
+        while True:
+            start = time.perf_counter()
+            new_V = self.storedValues(self.compiled.bellmanBackup(V))
+            delta = float(np.max(np.abs(new_V - V), initial=0.0))
+            V = new_V
+            self.numIters += 1
+            elapsed = time.perf_counter() - start
+            self.phaseTimes["backup"] += elapsed
+            self.steps.append({"iteration": self.numIters, "max_value_change": delta, "bellman_residual": delta, "time": elapsed})
+            if delta < self.valueTolerance(V, epsilon):
+                break
+
+        with self.timePhase("policy_extraction"):
+            self.pi = self.compiled.policyDict(self.compiled.greedyPolicy(V))
+            self.V = self.valueResult(self.compiled, V)
+        print(f"ValueIteration ({self.valueStorage} values): {self.numIters} iterations")
+
+    def solveEliminating(self, mdp: MDP, epsilon=0.001):
+        """Value iteration with bounds-based action elimination."""
+        if mdp.valueUpperBound(mdp.startState()) is None or mdp.valueLowerBound(mdp.startState()) is None:
+            raise ValueError(f"{type(mdp).__name__} does not provide valueUpperBound and valueLowerBound, which action elimination needs")
+        gamma = mdp.discount()
+        upper = {state: mdp.valueUpperBound(state) for state in mdp.states}
+        lower = {state: mdp.valueLowerBound(state) for state in mdp.states}
+        self.activeActions = {state: list(mdp.actions(state)) for state in mdp.states}
+        self.numEliminated = 0
+        cache = self.transitionCache
+        while True:
+            start = time.perf_counter()
+            delta = 0
+            eliminated = 0
+            V = self.V
+            new_V, new_upper, new_lower = {}, {}, {}
+            for state in mdp.states:
+                actions = self.activeActions[state]
+                if not actions:
+                    new_V[state] = new_upper[state] = new_lower[state] = 0
+                    continue
+                q_values = []
+                for action in actions:
+                    if cache is None:
+                        successors = mdp.succAndProbReward(state, action)
+                        self.numTransitionCalls += 1
+                    else:
+                        successors = cache.get(mdp, state, action)
+                    q = q_upper = q_lower = 0.0
+                    for next_state, prob, reward in successors:
+                        q += prob * (reward + gamma * V[next_state])
+                        q_upper += prob * (reward + gamma * upper[next_state])
+                        q_lower += prob * (reward + gamma * lower[next_state])
+                    q_values.append((q, q_upper, q_lower))
+                new_V[state] = max(q for q, q_upper, q_lower in q_values)
+                new_upper[state] = max(q_upper for q, q_upper, q_lower in q_values)
+                best_lower = new_lower[state] = max(q_lower for q, q_upper, q_lower in q_values)
+                delta = max(delta, abs(new_V[state] - V[state]))
+                # The margin keeps round-off from dropping an action tied for optimal.
+                margin = 1e-9 * max(1.0, abs(best_lower))
+                remaining = [action for action, (q, q_upper, q_lower) in zip(actions, q_values) if q_upper >= best_lower - margin]
+                if len(remaining) < len(actions):
+                    eliminated += len(actions) - len(remaining)
+                    self.activeActions[state] = remaining
+            self.V, upper, lower = new_V, new_upper, new_lower
+            self.numEliminated += eliminated
+            self.numIters += 1
+            elapsed = time.perf_counter() - start
+            self.phaseTimes["backup"] += elapsed
+            self.steps.append({"iteration": self.numIters, "max_value_change": delta, "bellman_residual": delta, "eliminated_actions": eliminated, "time": elapsed})
+            if delta < epsilon:
+                break
+            self.saveCheckpoint(mdp)
+
+        with self.timePhase("policy_extraction"):
+            self.pi = {}
+            for state in mdp.states:
+                actions = self.activeActions[state]
+                self.pi[state] = max(actions, key=lambda a: self.computeQ(mdp, self.V, state, a)) if actions else None
+        self.saveCheckpoint(mdp, complete=True)
+        total = sum(len(mdp.actions(state)) for state in mdp.states)
+        print(f"ValueIteration: {self.numIters} iterations, {self.numEliminated} of {total} (state, action) pairs eliminated")
+
 
 class PolicyIteration(MDPAlgorithm):
-    """Policy iteration algorithm."""
+    """Policy iteration algorithm.
+
+    evaluation selects how each policy is evaluated:
+    - "sweeps": in-place Gauss-Seidel sweeps until values change by less than epsilon
+    - "linear": solve (I - gamma P_pi) V = R_pi directly on the compiled MDP
+    """
+
+    ARRAY_VALUE_STORAGE = True
+
+    EVALUATION_MODES = ("sweeps", "linear")
+
+    def __init__(self, evaluation="sweeps", **kwargs):
+        super().__init__(**kwargs)
+        if evaluation not in self.EVALUATION_MODES:
+            raise ValueError(f"Unknown evaluation mode: {evaluation}")
+        self.evaluation = evaluation
 
     def solve(self, mdp: MDP, epsilon=1e-10):
         """Solve the MDP using policy iteration."""
+        self.resetTrace()
+        if self.evaluation == "linear":
+            return self.solveLinear(mdp, epsilon)
+        if self.valueType is not None:
+            return self.solveArray(mdp, epsilon)
+
         # Initialize
-        mdp.computeStates()
-        self.V = {state: 0 for state in mdp.states}
-        self.pi = {state: mdp.actions(state)[0] if mdp.actions(state) else None for state in mdp.states}
+        self.enumerateStates(mdp)
+        self.V = self.initialValues(mdp)
+        self.pi = self.initialPolicy(mdp)
         self.numIters = 0
+        if self.restoreCheckpoint(mdp):
+            return
 
         # BEGIN_YOUR_CODE
         is_policy_stable = False
         while not is_policy_stable:
             # Policy Evaluation
+            eval_start = time.perf_counter()
+            old_V = dict(self.V)
+            eval_residuals = []
             while True:
                 delta = 0
                 for state in mdp.states:
@@ -99,20 +588,751 @@ class PolicyIteration(MDPAlgorithm):
                     new_v = self.computeQ(mdp, self.V, state, action)
                     delta = max(delta, abs(self.V[state] - new_v))
                     self.V[state] = new_v
+                eval_residuals.append(delta)
                 if delta < epsilon:
                     break
+            eval_time = time.perf_counter() - eval_start
 
             # Policy Improvement
+            improve_start = time.perf_counter()
             is_policy_stable = True
+            policy_changes = 0
+            residual = 0
             for state in mdp.states:
                 actions = mdp.actions(state)
                 if not actions:
                     continue
-                best_action = max(actions, key=lambda a: self.computeQ(mdp, self.V, state, a))
+                q_values = [self.computeQ(mdp, self.V, state, a) for a in actions]
+                best_q = max(q_values)
+                best_action = actions[q_values.index(best_q)]
+                residual = max(residual, abs(best_q - self.V[state]))
                 if best_action != self.pi[state]:
                     self.pi[state] = best_action
                     is_policy_stable = False
+                    policy_changes += 1
+            improve_time = time.perf_counter() - improve_start
             self.numIters += 1
+            self.phaseTimes["evaluation"] += eval_time
+            self.phaseTimes["improvement"] += improve_time
+            self.steps.append(
+                {
+                    "iteration": self.numIters,
+                    "eval_iters": len(eval_residuals),
+                    "eval_residuals": eval_residuals,
+                    "max_value_change": max((abs(self.V[state] - old_V[state]) for state in mdp.states), default=0),
+                    "bellman_residual": residual,
+                    "policy_changes": policy_changes,
+                    "eval_time": eval_time,
+                    "improvement_time": improve_time,
+                }
+            )
+            if not is_policy_stable:
+                self.saveCheckpoint(mdp)
         # END_YOUR_CODE
 
+        self.saveCheckpoint(mdp, complete=True)
         print(f"PolicyIteration: {self.numIters} iterations")
+
+    def solveArray(self, mdp: MDP, epsilon=1e-10):
+        """Policy iteration over the compiled MDP with V in a flat array (see
+        valueStorage).  Policy evaluation sweeps all states synchronously
+        through P_pi instead of in place, so it needs more sweeps than
+        solve(), each of them a few NumPy reductions; the policy converges
+        to the same one."""
+        with self.timePhase("enumeration"):
+            self.compiled = compileMDP(mdp)
+        self.numTransitionCalls = self.compiled.numRows
+        compiled = self.compiled
+        gamma = compiled.discount
+        rows = compiled.firstRows() if self.warmPi is None else compiled.policyRows(self.warmPi)
+        acting = rows >= 0
+        V = self.storedValues(self.initialValueArray(compiled))
+        self.numIters = 0
+        while True:
+            # Policy Evaluation
+            eval_start = time.perf_counter()
+            old_V = V
+            indptr, indices, data, R = compiled.policyMatrix(rows)
+            owner = np.repeat(np.arange(compiled.numStates, dtype=np.int64), np.diff(indptr))
+            eval_residuals = []
+            while True:
+                new_V = np.where(acting, R + gamma * np.bincount(owner, weights=data * V[indices], minlength=compiled.numStates), V)
+                new_V = self.storedValues(new_V)
+                delta = float(np.max(np.abs(new_V - V), initial=0.0))
+                V = new_V
+                eval_residuals.append(delta)
+                if delta < self.valueTolerance(V, epsilon):
+                    break
+            eval_time = time.perf_counter() - eval_start
+
+            # Policy Improvement
+            improve_start = time.perf_counter()
+            Q = compiled.computeQ(V)
+            new_rows = compiled.greedyRows(Q, self.valueTolerance(V, 0.0))
+            residual = float(np.max(np.abs(compiled.maxQ(Q) - V)[acting], initial=0.0))
+            improve_time = time.perf_counter() - improve_start
+            self.numIters += 1
+            self.phaseTimes["evaluation"] += eval_time
+            self.phaseTimes["improvement"] += improve_time
+            self.steps.append(
+                {
+                    "iteration": self.numIters,
+                    "eval_iters": len(eval_residuals),
+                    "eval_residuals": eval_residuals,
+                    "max_value_change": float(np.max(np.abs(V - old_V), initial=0.0)),
+                    "bellman_residual": residual,
+                    "policy_changes": int(np.count_nonzero(new_rows != rows)),
+                    "eval_time": eval_time,
+                    "improvement_time": improve_time,
+                }
+            )
+            if np.array_equal(new_rows, rows):
+                break
+            rows = new_rows
+
+        self.V = self.valueResult(compiled, V)
+        self.pi = compiled.policyDict(np.where(rows >= 0, compiled.rowAction[np.maximum(rows, 0)], -1))
+        print(f"PolicyIteration ({self.valueStorage} values): {self.numIters} iterations")
+
+    def solveLinear(self, mdp: MDP, epsilon=1e-10):
+        """Policy iteration with exact policy evaluation on the compiled MDP.
+        Policy improvement picks the first action within epsilon of the best
+        Q value, so solver round-off cannot make tied actions flip forever."""
+        with self.timePhase("enumeration"):
+            self.compiled = compileMDP(mdp)
+        self.numTransitionCalls = self.compiled.numRows
+        rows = self.compiled.firstRows() if self.warmPi is None else self.compiled.policyRows(self.warmPi)
+        V = self.initialValueArray(self.compiled)
+        self.numIters = 0
+        while True:
+            eval_start = time.perf_counter()
+            new_V = self.compiled.evaluatePolicy(rows, V, epsilon)
+            eval_time = time.perf_counter() - eval_start
+            improve_start = time.perf_counter()
+            Q = self.compiled.computeQ(new_V)
+            new_rows = self.compiled.greedyRows(Q, epsilon)
+            improve_time = time.perf_counter() - improve_start
+            self.numIters += 1
+            self.phaseTimes["evaluation"] += eval_time
+            self.phaseTimes["improvement"] += improve_time
+            self.steps.append(
+                {
+                    "iteration": self.numIters,
+                    "eval_iters": 1,
+                    "max_value_change": float(np.max(np.abs(new_V - V), initial=0.0)),
+                    "bellman_residual": float(np.max(np.abs(self.compiled.maxQ(Q) - new_V), initial=0.0)),
+                    "policy_changes": int(np.count_nonzero(new_rows != rows)),
+                    "eval_time": eval_time,
+                    "improvement_time": improve_time,
+                }
+            )
+            V = new_V
+            if np.array_equal(new_rows, rows):
+                break
+            rows = new_rows
+
+        self.V = self.valueResult(self.compiled, V)
+        self.pi = self.compiled.policyDict(np.where(rows >= 0, self.compiled.rowAction[np.maximum(rows, 0)], -1))
+        print(f"PolicyIteration (linear evaluation): {self.numIters} iterations")
+
+
+class CompiledValueIteration(MDPAlgorithm):
+    """Value iteration over a CompiledMDP.  Produces the same V and pi as
+    ValueIteration, but each sweep is a handful of NumPy reductions instead of
+    a succAndProbReward call per (state, action) pair.
+
+    With encodeStates, an MDP that provides a stateCodec is enumerated and
+    compiled on integer codes; state tuples are only rebuilt for the final
+    V and pi dictionaries.  An MDP with shared states (see MDP.shareStates)
+    is compiled on those instead.
+    """
+
+    ARRAY_VALUE_STORAGE = True
+
+    def __init__(self, encodeStates=False, **kwargs):
+        super().__init__(**kwargs)
+        self.encodeStates = encodeStates
+
+    def solve(self, mdp: MDP, epsilon=0.001):
+        self.resetTrace()
+        codec = mdp.stateCodec() if self.encodeStates and mdp.sharedStates is None else None
+        with self.timePhase("enumeration"):
+            self.compiled = compileCodec(codec) if codec is not None else compileMDP(mdp)
+        self.numTransitionCalls = self.compiled.numRows
+        V = self.initialValueArray(self.compiled)
+        if codec is not None and self.warmV is not None:
+            V = np.array([self.warmV.get(codec.decode(code), 0) for code in self.compiled.states], dtype=np.float64)
+        V = self.storedValues(V)
+        self.numIters = 0
+        while True:
+            start = time.perf_counter()
+            new_V = self.storedValues(self.compiled.bellmanBackup(V))
+            delta = float(np.max(np.abs(new_V - V), initial=0.0))
+            V = new_V
+            self.numIters += 1
+            elapsed = time.perf_counter() - start
+            self.phaseTimes["backup"] += elapsed
+            self.steps.append({"iteration": self.numIters, "max_value_change": delta, "bellman_residual": delta, "time": elapsed})
+            if delta < self.valueTolerance(V, epsilon):
+                break
+
+        with self.timePhase("policy_extraction"):
+            self.V = self.valueResult(self.compiled, V)
+            self.pi = self.compiled.policyDict(self.compiled.greedyPolicy(V))
+        if codec is not None:
+            states = [codec.decode(code) for code in self.compiled.states]
+            self.V = dict(zip(states, V.tolist())) if self.valueType is None else StateValues(states, V)
+            self.pi = dict(zip(states, self.pi.values()))
+        print(f"CompiledValueIteration: {self.numIters} iterations")
+
+
+class OutOfCoreValueIteration(MDPAlgorithm):
+    """Value iteration for MDPs whose transitions do not fit in memory.  The
+    MDP is enumerated and compiled straight to files (see compileToDisk), on
+    integer codes when it provides a stateCodec, and every sweep streams the
+    transitions back chunk by chunk; only V, the next V and one chunk are
+    resident.  Produces the same V and pi as CompiledValueIteration.
+
+    directory holds the compiled files (a temporary directory, removed after
+    the solve, if None).  memoryLimit is a target for the resident set size,
+    in bytes: compile buffers and sweep chunks are sized to fit next to the
+    memory already in use (and, for sweeps, the two value arrays).  It cannot
+    bound the state index built during enumeration, which grows with the
+    number of states.  Without it chunks hold chunkTransitions transitions.
+    self.peakMemory is the largest resident set size sampled while compiling
+    and sweeping.
+
+    With materialize=False, self.V and self.pi are left None and the results
+    stay in self.values and self.policy (arrays in the order of
+    self.disk.states()), so no per-state Python objects are built at all.
+    """
+
+    # Resident bytes per streamed transition: next state, probability, reward,
+    # gathered value, contribution and owning row, with slack for temporaries.
+    BYTES_PER_TRANSITION = 64
+    # Resident bytes per transition buffered as Python objects while compiling.
+    COMPILE_BYTES_PER_TRANSITION = 160
+
+    def __init__(self, directory=None, memoryLimit=None, chunkTransitions=1 << 20, materialize=True, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        self.memoryLimit = memoryLimit
+        self.chunkTransitions = chunkTransitions
+        self.materialize = materialize
+        self.peakMemory = 0
+
+    def sampleMemory(self):
+        self.peakMemory = max(self.peakMemory, residentMemory())
+
+    def chunkBudget(self, reserved: int) -> int:
+        """Bytes left under memoryLimit for one chunk, after the memory in use
+        now and |reserved| more.  Raises MemoryError if nothing is left."""
+        inUse = residentMemory()
+        budget = self.memoryLimit - inUse - reserved
+        if budget < self.COMPILE_BYTES_PER_TRANSITION:
+            raise MemoryError(f"memoryLimit of {self.memoryLimit} bytes leaves no room for transitions ({inUse} bytes already resident)")
+        return budget
+
+    def solve(self, mdp: MDP, epsilon=0.001):
+        self.resetTrace()
+        codec = mdp.stateCodec()
+        directory = self.directory if self.directory is not None else tempfile.mkdtemp(prefix="mdp-transitions-")
+        try:
+            self.peakMemory = residentMemory()
+            chunkTransitions = self.chunkTransitions
+            if self.memoryLimit is not None:
+                chunkTransitions = self.chunkBudget(0) // self.COMPILE_BYTES_PER_TRANSITION
+            with self.timePhase("enumeration"):
+                self.disk = compileToDisk(codec if codec is not None else mdp, directory, chunkTransitions, onFlush=self.sampleMemory)
+            self.numTransitionCalls = self.disk.numRows
+            self.sampleMemory()
+            if self.memoryLimit is not None:
+                chunkTransitions = self.chunkBudget(2 * 8 * self.disk.numStates) // self.BYTES_PER_TRANSITION
+            chunks = self.disk.chunks(chunkTransitions)
+            self.numChunks = len(chunks)
+
+            V = np.zeros(self.disk.numStates)
+            self.numIters = 0
+            while True:
+                start = time.perf_counter()
+                new_V = np.empty_like(V)
+                for first, last in chunks:
+                    new_V[first:last] = self.disk.backupChunk(V, first, last)
+                    self.sampleMemory()
+                delta = float(np.max(np.abs(new_V - V), initial=0.0))
+                V = new_V
+                self.numIters += 1
+                elapsed = time.perf_counter() - start
+                self.phaseTimes["backup"] += elapsed
+                self.steps.append({"iteration": self.numIters, "max_value_change": delta, "bellman_residual": delta, "resident_bytes": self.peakMemory, "time": elapsed})
+                if delta < epsilon:
+                    break
+
+            with self.timePhase("policy_extraction"):
+                self.values = V
+                self.policy = np.concatenate([self.disk.greedyChunk(V, first, last) for first, last in chunks])
+                self.V = self.pi = None
+                if self.materialize:
+                    states = self.disk.states()
+                    if codec is not None:
+                        states = [codec.decode(code) for code in states]
+                    self.V = dict(zip(states, V.tolist()))
+                    self.pi = {state: self.disk.actionList[a] if a >= 0 else None for state, a in zip(states, self.policy.tolist())}
+        finally:
+            if self.directory is None:
+                shutil.rmtree(directory, ignore_errors=True)
+        print(f"OutOfCoreValueIteration: {self.numIters} iterations over {self.numChunks} chunks, peak resident memory {self.peakMemory / 2**20:.1f} MiB")
+
+
+class BisimulationValueIteration(MDPAlgorithm):
+    """Value iteration on the bisimulation quotient of the compiled MDP.
+    States that agree on actions, expected rewards and probabilities of
+    reaching every class are merged (see bisimulationBlocks), the smaller
+    quotient MDP is solved, and V and pi are lifted back: every state gets its
+    class's value and action.  With the default tolerance, classes are exact
+    up to round-off and V matches CompiledValueIteration within epsilon-level
+    differences; a larger tolerance trades accuracy for more merging.
+    Sets self.numBlocks and self.compressionRatio (states per class).
+    """
+
+    ARRAY_VALUE_STORAGE = True
+
+    def __init__(self, tolerance=1e-9, **kwargs):
+        super().__init__(**kwargs)
+        self.tolerance = tolerance
+
+    def solve(self, mdp: MDP, epsilon=0.001):
+        self.resetTrace()
+        with self.timePhase("enumeration"):
+            self.compiled = compileMDP(mdp)
+        self.numTransitionCalls = self.compiled.numRows
+        with self.timePhase("aggregation"):
+            blocks, self.numBlocks = bisimulationBlocks(self.compiled, self.tolerance)
+            self.quotient = quotientMDP(self.compiled, blocks, self.numBlocks)
+        self.compressionRatio = self.compiled.numStates / self.numBlocks if self.numBlocks else 1.0
+        V = self.storedValues(np.zeros(self.numBlocks))
+        self.numIters = 0
+        while True:
+            start = time.perf_counter()
+            new_V = self.storedValues(self.quotient.bellmanBackup(V))
+            delta = float(np.max(np.abs(new_V - V), initial=0.0))
+            V = new_V
+            self.numIters += 1
+            elapsed = time.perf_counter() - start
+            self.phaseTimes["backup"] += elapsed
+            self.steps.append({"iteration": self.numIters, "max_value_change": delta, "bellman_residual": delta, "time": elapsed})
+            if delta < self.valueTolerance(V, epsilon):
+                break
+
+        with self.timePhase("policy_extraction"):
+            self.V = self.valueResult(self.compiled, V[blocks])
+            self.pi = self.compiled.policyDict(self.quotient.greedyPolicy(V)[blocks])
+        print(f"BisimulationValueIteration: {self.compiled.numStates} states in {self.numBlocks} classes (compression {self.compressionRatio:.2f}x), {self.numIters} iterations")
+
+
+class BatchedValueIteration(MDPAlgorithm):
+    """Value iteration for K MDPs that share one transition structure and
+    differ only in rewards (e.g. BlackjackMDPs with different peekCost).  The
+    structure is compiled once and V is a (numStates, K) matrix, so each sweep
+    backs up every unconverged variant with a single sparse-times-dense product.
+
+    solveMany sets self.Vs / self.pis (one dict per MDP) and
+    self.numItersPerVariant (the sweep at which each variant's values changed
+    by less than epsilon, after which its column is no longer backed up);
+    solve(mdp) is the K = 1 case.  Each variant's rewards are read with
+    transitionsBatch when the MDPs have an array interface, and otherwise with
+    one succAndProbReward pass per MDP; callers that can write the
+    (numTransitions, K) reward matrix directly (e.g. replacing the rewards of
+    Peek transitions for a peekCost sweep) can compile once and call
+    solveRewards instead.
+    """
+
+    def solveMany(self, mdps: List[MDP], epsilon=0.001):
+        self.resetTrace()
+        with self.timePhase("enumeration"):
+            compiled = compileMDP(mdps[0])
+        with self.timePhase("reward_compilation"):
+            rewards = compiled.rewardMatrix(mdps)
+        self.solveRewards(compiled, rewards, epsilon)
+        self.numTransitionCalls = compiled.numRows * len(mdps)
+
+    def solveRewards(self, compiled: CompiledMDP, rewards: np.ndarray, epsilon=0.001):
+        """Solve the K reward variants given as columns of |rewards|
+        (numTransitions x K) over the transition structure of |compiled|."""
+        self.compiled = compiled
+        with self.timePhase("reward_compilation"):
+            rowRewards = self.compiled.sumRows(self.compiled.prob[:, None] * rewards)
+        numVariants = rewards.shape[1]
+        V = np.zeros((self.compiled.numStates, numVariants))
+        converged = np.zeros(numVariants, dtype=np.int64)
+        self.numIters = 0
+        while True:
+            start = time.perf_counter()
+            # Converged variants are frozen; only the active columns are backed up.
+            active = np.flatnonzero(converged == 0)
+            new_V = self.compiled.maxQMany(self.compiled.computeQMany(V[:, active], rowRewards[:, active]))
+            delta = np.max(np.abs(new_V - V[:, active]), axis=0, initial=0.0)
+            V[:, active] = new_V
+            self.numIters += 1
+            converged[active[delta < epsilon]] = self.numIters
+            elapsed = time.perf_counter() - start
+            self.phaseTimes["backup"] += elapsed
+            self.steps.append({"iteration": self.numIters, "max_value_change": float(np.max(delta, initial=0.0)), "active_variants": len(active), "converged_variants": int(np.count_nonzero(converged)), "time": elapsed})
+            if np.all(converged):
+                break
+
+        with self.timePhase("policy_extraction"):
+            actions = self.compiled.greedyPolicyMany(self.compiled.computeQMany(V, rowRewards))
+            states = list(self.compiled.states)
+            self.Vs = [self.compiled.valueDict(V[:, k], states) for k in range(numVariants)]
+            self.pis = [self.compiled.policyDict(actions[:, k], states) for k in range(numVariants)]
+        self.numItersPerVariant = converged.tolist()
+        self.V, self.pi = self.Vs[0], self.pis[0]
+        print(f"BatchedValueIteration: {self.numIters} iterations for {numVariants} variants")
+
+    def solve(self, mdp: MDP, epsilon=0.001):
+        self.solveMany([mdp], epsilon)
+
+
+class PrioritizedSweepingValueIteration(MDPAlgorithm):
+    """Asynchronous value iteration that only backs up states whose successors
+    changed.  After one in-place sweep over mdp.states, every change |dV| at a
+    state s adds gamma * T(p, a, s) * |dV| to the pending error bound of each
+    predecessor p, and p is queued (largest bound first) once that bound
+    exceeds epsilon.  At termination every state's Bellman residual is below
+    epsilon, so V and pi agree with ValueIteration within tolerance.
+    self.numIters counts individual state backups, not sweeps.
+    """
+
+    def solve(self, mdp: MDP, epsilon=0.001):
+        self.resetTrace()
+        self.enumerateStates(mdp, trackPredecessors=True)
+        self.V = self.initialValues(mdp)
+        self.numIters = 0
+        gamma = mdp.discount()
+        pending = collections.defaultdict(float)  # accumulated error bound per state
+        queue = []
+        counter = itertools.count()  # tie-breaker: states need not be comparable
+
+        def backup(state):
+            actions = mdp.actions(state)
+            new_v = max(self.computeQ(mdp, self.V, state, action) for action in actions) if actions else 0
+            change = abs(new_v - self.V[state])
+            self.V[state] = new_v
+            pending[state] = 0.0
+            self.numIters += 1
+            if change == 0:
+                return
+            for pred, prob in mdp.predecessors.get(state, {}).items():
+                pending[pred] += gamma * prob * change
+                if pending[pred] > epsilon:
+                    heapq.heappush(queue, (-pending[pred], next(counter), pred))
+
+        with self.timePhase("backup"):
+            for state in mdp.states:
+                backup(state)
+            self.steps.append({"iteration": 1, "phase": "initial_sweep", "backups": self.numIters, "queued": len(queue)})
+            while queue:
+                priority, _, state = heapq.heappop(queue)
+                if -priority != pending[state]:
+                    continue  # stale entry: superseded by a larger bound or already backed up
+                backup(state)
+            self.steps.append({"iteration": 2, "phase": "prioritized", "backups": self.numIters - self.steps[0]["backups"]})
+
+        with self.timePhase("policy_extraction"):
+            self.pi = self.computeOptimalPolicy(mdp, self.V)
+        print(f"PrioritizedSweepingValueIteration: {self.numIters} backups over {len(mdp.states)} states")
+
+
+class ModifiedPolicyIteration(MDPAlgorithm):
+    """Modified policy iteration: each iteration is one greedy (improvement)
+    backup followed by evalSweeps in-place evaluation sweeps of the greedy
+    policy, instead of evaluating every policy to convergence.  Stops when the
+    improvement backup changes every value by less than epsilon, as
+    ValueIteration does.  evalSweeps = 0 is value iteration; a very large
+    evalSweeps approaches PolicyIteration.
+
+    schedule selects how the number of sweeps evolves:
+    - "fixed": always evalSweeps
+    - "adaptive": doubled (up to maxEvalSweeps) while the policy is stable,
+      i.e. an improvement step changes at most 1% of the actions, and halved
+      (down to 1) when it changes more
+    """
+
+    SCHEDULES = ("fixed", "adaptive")
+
+    def __init__(self, evalSweeps=5, schedule="fixed", maxEvalSweeps=256, **kwargs):
+        super().__init__(**kwargs)
+        if schedule not in self.SCHEDULES:
+            raise ValueError(f"Unknown evaluation schedule: {schedule}")
+        self.evalSweeps = evalSweeps
+        self.schedule = schedule
+        self.maxEvalSweeps = maxEvalSweeps
+
+    def solve(self, mdp: MDP, epsilon=0.001):
+        self.resetTrace()
+        self.enumerateStates(mdp)
+        self.V = self.initialValues(mdp)
+        self.pi = {}
+        self.numIters = 0
+        self.numEvalSweeps = 0
+        k = self.evalSweeps
+        while True:
+            # Policy improvement: one Bellman optimality backup
+            improve_start = time.perf_counter()
+            delta = 0
+            policy_changes = 0
+            new_V = {}
+            for state in mdp.states:
+                best_action, best_q = None, 0
+                for action in mdp.actions(state):
+                    q = self.computeQ(mdp, self.V, state, action)
+                    if best_action is None or q > best_q:
+                        best_action, best_q = action, q
+                if self.pi.get(state) != best_action:
+                    policy_changes += 1
+                    self.pi[state] = best_action
+                new_V[state] = best_q
+                delta = max(delta, abs(best_q - self.V[state]))
+            self.V = new_V
+            self.numIters += 1
+            improve_time = time.perf_counter() - improve_start
+            self.phaseTimes["improvement"] += improve_time
+            step = {"iteration": self.numIters, "max_value_change": delta, "bellman_residual": delta, "policy_changes": policy_changes, "eval_iters": 0, "improvement_time": improve_time, "eval_time": 0.0}
+            self.steps.append(step)
+            if delta < epsilon:
+                break
+
+            # Partial policy evaluation
+            eval_start = time.perf_counter()
+            for _ in range(k):
+                for state in mdp.states:
+                    action = self.pi[state]
+                    if action is not None:
+                        self.V[state] = self.computeQ(mdp, self.V, state, action)
+            self.numEvalSweeps += k
+            step["eval_iters"] = k
+            step["eval_time"] = time.perf_counter() - eval_start
+            self.phaseTimes["evaluation"] += step["eval_time"]
+
+            if self.schedule == "adaptive":
+                if policy_changes <= 0.01 * len(mdp.states):
+                    k = min(max(2 * k, 1), self.maxEvalSweeps)
+                else:
+                    k = max(k // 2, 1)
+
+        with self.timePhase("policy_extraction"):
+            self.pi = self.computeOptimalPolicy(mdp, self.V)
+        print(f"ModifiedPolicyIteration: {self.numIters} iterations, {self.numEvalSweeps} evaluation sweeps")
+
+
+def stronglyConnectedComponents(states, successors: Dict[Any, List[Any]]) -> List[List[Any]]:
+    """Tarjan's algorithm (iterative).  Components are returned in reverse
+    topological order: every edge leaving a component points into one that
+    appears earlier in the list."""
+    index = {}
+    lowlink = {}
+    onStack = set()
+    stack = []
+    components = []
+    counter = 0
+    for root in states:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        onStack.add(root)
+        work = [(root, iter(successors.get(root, ())))]
+        while work:
+            node, children = work[-1]
+            advanced = False
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    onStack.add(child)
+                    work.append((child, iter(successors.get(child, ()))))
+                    advanced = True
+                    break
+                if child in onStack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    onStack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+    return components
+
+
+class TopologicalValueIteration(MDPAlgorithm):
+    """Value iteration on the strongly connected components of the state graph,
+    solved in reverse topological order.  When a component is reached all of
+    its successors outside the component are already final, so an acyclic
+    singleton needs exactly one backup and only genuinely cyclic components
+    iterate (until their values change by less than epsilon).  BlackjackMDP
+    is acyclic, so this is a single pass over the states.
+    self.numIters counts individual state backups.
+    """
+
+    def solve(self, mdp: MDP, epsilon=0.001):
+        self.resetTrace()
+        self.enumerateStates(mdp, trackPredecessors=True)
+        self.V = self.initialValues(mdp)
+        self.numIters = 0
+        with self.timePhase("decomposition"):
+            successors = collections.defaultdict(list)
+            for state, preds in mdp.predecessors.items():
+                for pred in preds:
+                    successors[pred].append(state)
+            components = stronglyConnectedComponents(mdp.states, successors)
+        self.numComponents = len(components)
+        self.numCyclicComponents = 0
+
+        def backup(state):
+            actions = mdp.actions(state)
+            new_v = max(self.computeQ(mdp, self.V, state, action) for action in actions) if actions else 0
+            change = abs(new_v - self.V[state])
+            self.V[state] = new_v
+            self.numIters += 1
+            return change
+
+        start = time.perf_counter()
+        for component in components:
+            state = component[0]
+            if len(component) == 1 and state not in successors[state]:
+                backup(state)
+                continue
+            self.numCyclicComponents += 1
+            sweeps = 0
+            while True:
+                delta = 0
+                for state in component:
+                    delta = max(delta, backup(state))
+                sweeps += 1
+                if delta < epsilon:
+                    break
+            self.steps.append({"iteration": len(self.steps) + 1, "component_size": len(component), "eval_iters": sweeps, "max_value_change": delta})
+        self.phaseTimes["backup"] += time.perf_counter() - start
+
+        with self.timePhase("policy_extraction"):
+            self.pi = self.computeOptimalPolicy(mdp, self.V)
+        print(f"TopologicalValueIteration: {self.numIters} backups over {len(mdp.states)} states ({self.numCyclicComponents} of {self.numComponents} components cyclic)")
+
+
+class LAOStar(MDPAlgorithm):
+    """Heuristic search (improved LAO*) from mdp.startState() that never
+    enumerates the full state space.  Unexpanded states are valued by the
+    admissible upper bound mdp.valueUpperBound(state).  Each iteration walks
+    the greedy solution graph depth-first from the start state, expands the
+    unexpanded states it reaches (fetching their transitions and bounding their
+    successors), and backs up the visited states in postorder.  It stops when a
+    walk expands nothing, changes no greedy action and changes every value by
+    less than epsilon, so the walk covered exactly the states the greedy policy
+    can reach and that policy is optimal on all of them.
+
+    self.V and self.pi cover only that envelope (the states reachable from the
+    start state under self.pi); mdp.states is set to it as well.
+    self.numExpandedStates counts the states whose transitions were fetched.
+    """
+
+    def solve(self, mdp: MDP, epsilon=0.001):
+        self.resetTrace()
+        start = mdp.startState()
+        if mdp.valueUpperBound(start) is None:
+            raise ValueError(f"{type(mdp).__name__} does not provide valueUpperBound, which LAOStar needs as its heuristic")
+        self.numIters = 0
+        gamma = mdp.discount()
+        V = {start: mdp.valueUpperBound(start)}
+        pi = {}
+        transitions = {}  # expanded state -> [(action, successors)]
+
+        def expand(state):
+            transitions[state] = []
+            for action in mdp.actions(state):
+                successors = tuple(mdp.succAndProbReward(state, action))
+                self.numTransitionCalls += 1
+                transitions[state].append((action, successors))
+                for next_state, prob, reward in successors:
+                    if next_state not in V:
+                        V[next_state] = mdp.valueUpperBound(next_state)
+
+        policyChanges = 0
+
+        def backup(state):
+            nonlocal policyChanges
+            best_action, best_q = None, 0
+            for action, successors in transitions[state]:
+                q = sum(prob * (reward + gamma * V[next_state]) for next_state, prob, reward in successors)
+                if best_action is None or q > best_q:
+                    best_action, best_q = action, q
+            change = abs(best_q - V[state])
+            V[state] = best_q
+            # A new greedy action leads to successors this walk did not visit.
+            if state in pi and pi[state] != best_action:
+                policyChanges += 1
+            pi[state] = best_action
+            return change
+
+        def greedySuccessors(state):
+            for action, successors in transitions[state]:
+                if action == pi[state]:
+                    return [next_state for next_state, prob, reward in successors]
+            return []
+
+        while True:
+            iter_start = time.perf_counter()
+            expansion_time = self.phaseTimes["expansion"]
+            expanded = 0
+            policyChanges = 0
+            delta = 0
+            visited = {start}
+            work = []
+            if start in transitions:
+                work.append((start, iter(greedySuccessors(start))))
+            else:
+                with self.timePhase("expansion"):
+                    expand(start)
+                expanded += 1
+                delta = backup(start)
+            while work:
+                state, children = work[-1]
+                child = next((child for child in children if child not in visited), None)
+                if child is None:
+                    work.pop()
+                    delta = max(delta, backup(state))
+                    continue
+                visited.add(child)
+                if child in transitions:
+                    work.append((child, iter(greedySuccessors(child))))
+                else:
+                    # A new tip state: expand and bound it, but do not descend
+                    # until the next walk, when its value reflects the expansion.
+                    with self.timePhase("expansion"):
+                        expand(child)
+                    expanded += 1
+                    delta = max(delta, backup(child))
+            self.numIters += 1
+            self.phaseTimes["backup"] += time.perf_counter() - iter_start - (self.phaseTimes["expansion"] - expansion_time)
+            self.steps.append({"iteration": self.numIters, "max_value_change": delta, "bellman_residual": delta, "expanded_states": expanded, "policy_changes": policyChanges, "solution_states": len(visited), "time": time.perf_counter() - iter_start})
+            if expanded == 0 and policyChanges == 0 and delta < epsilon:
+                break
+
+        self.numExpandedStates = len(transitions)
+        mdp.states = visited
+        mdp.stateIndex = None
+        mdp.predecessors = None
+        self.V = {state: V[state] for state in visited}
+        self.pi = {state: pi[state] for state in visited}
+        print(f"LAOStar: {self.numIters} iterations, {self.numExpandedStates} expanded states, {len(visited)} states in the optimal envelope")
@@ -0,0 +1,113 @@
+import json, os
+import numpy as np
+from typing import Dict, Any, List, Optional
+from mdp import MDP, NumberLineMDP, BlackjackMDP
+
+
+# MDP classes a table can rebuild from the name and parameters in its header.
+MDP_CLASSES = {cls.__name__: cls for cls in (NumberLineMDP, BlackjackMDP)}
+
+
+# Compact lookup table of a solved policy, for MDPs with the array interface.
+# States are stored by their int64 index (MDP.stateIndices), sorted, next to
+# an int16 array of action codes into |actions| (-1 = None).  A single state
+# is found by binary search, or by offset when the indices are contiguous
+# (as for NumberLineMDP); lookupCodes answers a whole array of indices with
+# one searchsorted.  The file layout is
+#   -- MAGIC and the header length as a little-endian uint64
+#   -- JSON header: MDP class name and parameters(), actions, number of states
+#   -- padding to 8 bytes, then the codes (int64) and action codes (int16)
+# so that load() can memory-map both arrays instead of reading them.
+class PolicyTable:
+    MAGIC = b"MDPPOLv1"
+
+    def __init__(self, mdp: MDP, codes: np.ndarray, actionCodes: np.ndarray, actions: List[Any]):
+        self.mdp = mdp
+        self.codes = codes
+        self.actionCodes = actionCodes
+        self.actions = list(actions)
+        # Contiguous codes are found by offset instead of binary search.
+        self.firstCode = int(codes[0]) if len(codes) and int(codes[-1]) - int(codes[0]) == len(codes) - 1 else None
+
+    @classmethod
+    def fromPolicy(cls, mdp: MDP, pi: Dict[Any, Any]) -> "PolicyTable":
+        actions = mdp.batchActions()
+        if actions is None:
+            raise ValueError(f"{type(mdp).__name__} has no array interface to index its states")
+        actionCodes = {action: i for i, action in enumerate(actions)}
+        states = list(pi)
+        codes = np.asarray(mdp.stateIndices(states), dtype=np.int64)
+        policy = np.array([actionCodes[pi[state]] if pi[state] is not None else -1 for state in states], dtype=np.int16)
+        order = np.argsort(codes, kind="stable")
+        return cls(mdp, codes[order], policy[order], actions)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def positions(self, codes: np.ndarray):
+        """Positions of |codes| in the table, and whether each was found."""
+        codes = np.asarray(codes, dtype=np.int64)
+        if self.firstCode is not None:
+            positions = codes - self.firstCode
+            found = (positions >= 0) & (positions < len(self.codes))
+            return np.where(found, positions, 0), found
+        if len(self.codes) == 0:
+            return np.zeros(len(codes), dtype=np.int64), np.zeros(len(codes), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.codes, codes), len(self.codes) - 1)
+        return positions, self.codes[positions] == codes
+
+    def lookupCodes(self, codes: np.ndarray) -> np.ndarray:
+        """Action codes (indices into self.actions, -1 = None) of an array of
+        state indices; raises KeyError for an index the table does not cover."""
+        positions, found = self.positions(codes)
+        if not np.all(found):
+            raise KeyError(int(np.asarray(codes)[~found][0]))
+        return self.actionCodes[positions]
+
+    def lookupBatch(self, states) -> List[Any]:
+        """Actions of a sequence of states; raises KeyError for a state the table does not cover."""
+        positions, found = self.positions(self.mdp.stateIndices(states))
+        if not np.all(found):
+            raise KeyError(states[int(np.flatnonzero(~found)[0])])
+        return [self.actions[a] if a >= 0 else None for a in self.actionCodes[positions].tolist()]
+
+    def lookup(self, state) -> Any:
+        return self.lookupBatch([state])[0]
+
+    def toDict(self) -> Dict[Any, Any]:
+        """The policy as a state -> action dict, as solvers produce it."""
+        return dict(zip(self.mdp.indexedStates(self.codes), [self.actions[a] if a >= 0 else None for a in self.actionCodes.tolist()]))
+
+    def save(self, path: str):
+        header = json.dumps({"mdp": type(self.mdp).__name__, "parameters": self.mdp.parameters(), "actions": self.actions, "size": len(self.codes)}).encode()
+        padding = -(len(self.MAGIC) + 8 + len(header)) % 8
+        tmpPath = path + ".tmp"
+        with open(tmpPath, "wb") as f:
+            f.write(self.MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header + b" " * padding)
+            f.write(np.ascontiguousarray(self.codes, dtype="<i8").tobytes())
+            f.write(np.ascontiguousarray(self.actionCodes, dtype="<i2").tobytes())
+        os.replace(tmpPath, path)
+
+    @classmethod
+    def load(cls, path: str, mdp: Optional[MDP] = None) -> "PolicyTable":
+        """Memory-map a table written by save().  Without |mdp|, the MDP is
+        rebuilt from the class name and parameters stored in the header."""
+        with open(path, "rb") as f:
+            if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError(f"{path} is not a policy table")
+            headerLength = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(headerLength))
+        if mdp is None:
+            if header["mdp"] not in MDP_CLASSES or header["parameters"] is None:
+                raise ValueError(f"Cannot rebuild {header['mdp']} from {path}; pass the MDP")
+            mdp = MDP_CLASSES[header["mdp"]](**header["parameters"])
+        offset = len(cls.MAGIC) + 8 + headerLength
+        offset += -offset % 8
+        size = header["size"]
+        if size == 0:
+            return cls(mdp, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int16), header["actions"])
+        codes = np.memmap(path, dtype="<i8", mode="r", offset=offset, shape=(size,))
+        actionCodes = np.memmap(path, dtype="<i2", mode="r", offset=offset + 8 * size, shape=(size,))
+        return cls(mdp, codes, actionCodes, header["actions"])
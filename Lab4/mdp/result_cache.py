@@ -0,0 +1,86 @@
+import hashlib, json, os, pickle
+import numpy as np
+from typing import Dict, Any, Tuple, Optional
+from mdp import MDP
+from compiled_mdp import StateValues
+
+
+# Content-addressed on-disk store of solved MDPs.
+# Each entry is one file <key>.pkl in |directory| holding
+#   -- states: the states in index order
+#   -- values: float64 array, V[i] for states[i]
+#   -- policy: int16 array, index into actions (-1 = None)
+#   -- actions, meta: the action list and the solver's metadata (iterations, ...)
+# The key is a SHA-256 of everything that determines the solution: the MDP
+# class and its parameters(), the algorithm and its options, and epsilon,
+# salted with VERSION.  Solver code is not part of the key, so VERSION must be
+# bumped by any change that alters solutions or the entry format; otherwise
+# old entries keep being served (main.py --no-cache bypasses the cache).
+# Entries are written atomically, and their modification time records the
+# last use; once the directory holds more than maxBytes, the least recently
+# used entries are deleted.
+class ResultCache:
+    VERSION = 1
+
+    def __init__(self, directory: str, maxBytes: int = 256 * 2**20):
+        self.directory = directory
+        self.maxBytes = maxBytes
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".pkl")
+
+    def key(self, mdp: MDP, algorithm: str, options: Dict[str, Any], epsilon: float) -> Optional[str]:
+        """Return the cache key of solving |mdp| with |algorithm|, or None if
+        the MDP does not describe its parameters (and so cannot be cached)."""
+        parameters = mdp.parameters()
+        if parameters is None:
+            return None
+        description = {"version": self.VERSION, "mdp": type(mdp).__name__, "parameters": parameters, "algorithm": algorithm, "options": options, "epsilon": epsilon}
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=repr).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[Dict[Any, float], Dict[Any, Any], Dict[str, Any]]]:
+        """Return (V, pi, meta) stored under |key|, or None on a miss."""
+        try:
+            with open(self.path(key), "rb") as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        os.utime(self.path(key))
+        states, actions = entry["states"], entry["actions"]
+        V = dict(zip(states, entry["values"].tolist()))
+        pi = {state: actions[a] if a >= 0 else None for state, a in zip(states, entry["policy"].tolist())}
+        return V, pi, entry["meta"]
+
+    def put(self, key: str, V: Dict[Any, float], pi: Dict[Any, Any], meta: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        states = list(V)
+        # Array-backed values are copied as a whole instead of looked up state by state.
+        values = V.array.astype(np.float64) if isinstance(V, StateValues) else np.array([V[state] for state in states], dtype=np.float64)
+        actions = sorted({action for action in pi.values() if action is not None}, key=repr)
+        actionCodes = {action: i for i, action in enumerate(actions)}
+        entry = {
+            "states": states,
+            "values": values,
+            "policy": np.array([actionCodes[pi[state]] if pi.get(state) is not None else -1 for state in states], dtype=np.int16),
+            "actions": actions,
+            "meta": meta,
+        }
+        tmpPath = self.path(key) + ".tmp"
+        with open(tmpPath, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpPath, self.path(key))
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in maxBytes."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
@@ -0,0 +1,121 @@
+import statistics
+import numpy as np
+from typing import Dict, Any, Tuple
+from mdp import BlackjackMDP, BlackjackStateCodec
+
+
+# Monte Carlo simulation of a fixed policy on a BlackjackMDP, vectorized across
+# episodes.  A batch of episodes is a set of parallel arrays
+#   -- total: hand total, peek: index of the peeked card (-1 if none)
+#   -- deck: (episodes, cards) counts of the cards left
+#   -- done: whether the episode has ended, ret: discounted return so far
+# and every step advances all running episodes at once, following the same
+# transitions as BlackjackMDP.succAndProbReward.  The policy is looked up by
+# encoding the states with BlackjackStateCodec and binary-searching a sorted
+# table of the codes the policy covers.
+class BlackjackSimulator:
+    def __init__(self, mdp: BlackjackMDP, pi: Dict[Tuple, Any]):
+        self.mdp = mdp
+        self.codec = BlackjackStateCodec(mdp)
+        if self.codec.numCodes >= 2**63:
+            raise ValueError("Deck too large to encode states as int64")
+        self.cardValues = np.array(mdp.cardValues, dtype=np.int64)
+        self.deckWeights = np.array(self.codec.deckWeights, dtype=np.int64)
+        self.actionList = list(self.codec.actionList)
+        self.take, self.peek, self.quit = (self.actionList.index(action) for action in ("Take", "Peek", "Quit"))
+        covered = [(self.codec.encode(state), self.actionList.index(action)) for state, action in pi.items() if state[2] is not None and action is not None]
+        covered.sort()
+        self.policyCodes = np.array([code for code, _ in covered], dtype=np.int64)
+        self.policyActions = np.array([action for _, action in covered], dtype=np.int64)
+
+    def encode(self, total: np.ndarray, peek: np.ndarray, deck: np.ndarray) -> np.ndarray:
+        """Vectorized BlackjackStateCodec.encode for states that have not ended."""
+        return (total - self.codec.minTotal) * self.codec.totalWeight + (peek + 1) * self.codec.peekWeight + deck @ self.deckWeights
+
+    def lookup(self, codes: np.ndarray) -> np.ndarray:
+        """Action index chosen by the policy in each encoded state."""
+        positions = np.minimum(np.searchsorted(self.policyCodes, codes), len(self.policyCodes) - 1)
+        if len(codes) and (len(self.policyCodes) == 0 or np.any(self.policyCodes[positions] != codes)):
+            missing = codes[self.policyCodes[positions] != codes][0] if len(self.policyCodes) else codes[0]
+            raise ValueError(f"Policy has no action for state {self.codec.decode(int(missing))}")
+        return self.policyActions[positions]
+
+    def drawCards(self, deck: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """Sample a card index per row of |deck|, proportionally to the counts."""
+        cumulative = np.cumsum(deck, axis=1)
+        draws = rng.integers(0, cumulative[:, -1])
+        return np.argmax(cumulative > draws[:, None], axis=1)
+
+    def runBatch(self, episodes: int, rng: np.random.Generator) -> np.ndarray:
+        """Simulate |episodes| episodes from the start state; return their returns."""
+        mdp = self.mdp
+        gamma = mdp.discount()
+        total = np.zeros(episodes, dtype=np.int64)
+        peek = np.full(episodes, -1, dtype=np.int64)
+        deck = np.full((episodes, len(self.cardValues)), mdp.multiplicity, dtype=np.int64)
+        ret = np.zeros(episodes)
+        weight = 1.0
+        running = np.arange(episodes) if deck.shape[1] and mdp.multiplicity > 0 else np.arange(0)
+        while len(running):
+            actions = self.lookup(self.encode(total[running], peek[running], deck[running]))
+            ended = np.zeros(len(running), dtype=bool)
+
+            quitting = actions == self.quit
+            ret[running[quitting]] += weight * total[running[quitting]]
+            ended |= quitting
+
+            # Peeking twice has no successors, so the episode ends with nothing more.
+            peeking = actions == self.peek
+            repeek = peeking & (peek[running] >= 0)
+            ended |= repeek
+            peeking &= ~repeek
+            rows = running[peeking]
+            peek[rows] = self.drawCards(deck[rows], rng)
+            ret[rows] -= weight * mdp.peekCost
+
+            taking = actions == self.take
+            rows = running[taking]
+            cards = peek[rows].copy()
+            unpeeked = cards < 0
+            cards[unpeeked] = self.drawCards(deck[rows[unpeeked]], rng)
+            deck[rows, cards] -= 1
+            peek[rows] = -1
+            total[rows] += self.cardValues[cards]
+            bust = total[rows] > mdp.threshold
+            empty = ~bust & (deck[rows].sum(axis=1) == 0)
+            ret[rows[empty]] += weight * total[rows[empty]]
+            takeEnded = np.zeros(len(running), dtype=bool)
+            takeEnded[np.flatnonzero(taking)] = bust | empty
+            ended |= takeEnded
+
+            running = running[~ended]
+            weight *= gamma
+        return ret
+
+    def simulate(self, episodes: int, seed=None, batchSize: int = 1 << 18, confidence: float = 0.95) -> Dict[str, Any]:
+        """Run |episodes| episodes in batches of |batchSize| and summarize the
+        returns: mean, standard deviation and error, a normal-approximation
+        confidence interval and the empirical distribution of returns."""
+        rng = np.random.default_rng(seed)
+        batches = []
+        remaining = episodes
+        while remaining > 0:
+            size = min(batchSize, remaining)
+            batches.append(self.runBatch(size, rng))
+            remaining -= size
+        returns = np.concatenate(batches) if batches else np.zeros(0)
+        mean = float(returns.mean()) if episodes else float("nan")
+        std = float(returns.std(ddof=1)) if episodes > 1 else 0.0
+        stderr = std / np.sqrt(episodes) if episodes else float("nan")
+        z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+        values, counts = np.unique(returns, return_counts=True)
+        return {
+            "episodes": episodes,
+            "mean": mean,
+            "std": std,
+            "stderr": stderr,
+            "confidence": confidence,
+            "ci_low": mean - z * stderr,
+            "ci_high": mean + z * stderr,
+            "distribution": dict(zip(values.tolist(), (counts / episodes).tolist())),
+        }
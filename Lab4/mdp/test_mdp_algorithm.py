@@ -0,0 +1,115 @@
+import pytest
+import compiled_mdp, mdp_algorithm
+from mdp import BlackjackMDP
+from mdp_algorithm import BatchedValueIteration, CompiledValueIteration, LAOStar, ModifiedPolicyIteration, OutOfCoreValueIteration, PolicyIteration, PrioritizedSweepingValueIteration, TopologicalValueIteration, ValueIteration
+
+
+def solveValueIteration(mdp):
+    algorithm = ValueIteration()
+    algorithm.solve(mdp, epsilon=1e-10)
+    return algorithm.V
+
+
+# A greedy action that changes during a walk leads to states the walk did not
+# visit; LAOStar used to stop there with V(start) = 10.5 instead of 10.
+@pytest.mark.parametrize("params", [([10, 0], 2, 13, 0), ([1, 5], 2, 10, 1), ([2, 3, 4], 2, 6, 3), ([-1, 2, 3], 2, 5, 1)])
+def test_lao_star_matches_value_iteration(params):
+    mdp = BlackjackMDP(*params)
+    algorithm = LAOStar()
+    algorithm.solve(mdp, epsilon=1e-10)
+    start = mdp.startState()
+    assert algorithm.V[start] == pytest.approx(solveValueIteration(BlackjackMDP(*params))[start])
+    # The envelope is closed under the greedy policy.
+    for state, action in algorithm.pi.items():
+        for newState, prob, reward in (mdp.succAndProbReward(state, action) if action is not None else []):
+            assert newState in algorithm.V
+
+
+# Decks with negative cards reach negative totals, where V* can be 0 (a bust,
+# or the transition-less Peek of a peeked state) while the total is below 0.
+@pytest.mark.parametrize("params", [([5, -1, -3, -3], 3, 8, 2), ([-1, 2, 3], 2, 5, 1), ([4, -2], 3, 6, 1)])
+def test_blackjack_value_bounds_hold(params):
+    mdp = BlackjackMDP(*params)
+    V = solveValueIteration(mdp)
+    for state in mdp.states:
+        assert mdp.valueLowerBound(state) - 1e-9 <= V[state] <= mdp.valueUpperBound(state) + 1e-9
+
+
+def test_eliminate_actions_with_negative_cards():
+    params = ([5, -1, -3, -3], 3, 8, 2)
+    algorithm = ValueIteration(eliminateActions=True)
+    algorithm.solve(BlackjackMDP(*params), epsilon=1e-10)
+    start = BlackjackMDP(*params).startState()
+    assert algorithm.V[start] == pytest.approx(solveValueIteration(BlackjackMDP(*params))[start])
+
+
+# Batch runs enumerate each structure once and share the states with every
+# configuration; compiled solvers must use them instead of searching again.
+@pytest.mark.parametrize("makeAlgorithm", [CompiledValueIteration, lambda: CompiledValueIteration(encodeStates=True), BatchedValueIteration])
+def test_compiled_solvers_reuse_shared_states(monkeypatch, makeAlgorithm):
+    params = ([1, 2, 3], 2, 6, 1)
+    enumerated = BlackjackMDP(*params)
+    enumerated.computeStates()
+
+    def searchAgain(mdp):
+        raise AssertionError("reachable states were searched again")
+
+    monkeypatch.setattr(compiled_mdp, "reachableIndices", searchAgain)
+    monkeypatch.setattr(mdp_algorithm, "compileCodec", searchAgain)
+    mdp = BlackjackMDP(*params)
+    mdp.shareStates(enumerated.states)
+    algorithm = makeAlgorithm()
+    algorithm.solve(mdp, epsilon=1e-10)
+    expected = solveValueIteration(BlackjackMDP(*params))
+    assert set(algorithm.V) == enumerated.states
+    for state in enumerated.states:
+        assert algorithm.V[state] == pytest.approx(expected[state])
+
+
+# Resuming from the checkpoint of a finished solve restores it as it was.
+@pytest.mark.parametrize("makeAlgorithm", [ValueIteration, PolicyIteration, lambda **kwargs: ValueIteration(eliminateActions=True, **kwargs)])
+def test_resume_finished_checkpoint(tmp_path, makeAlgorithm):
+    params = ([1, 5], 2, 10, 1)
+    finished = makeAlgorithm(checkpoint=str(tmp_path))
+    finished.solve(BlackjackMDP(*params))
+    resumed = makeAlgorithm(checkpoint=str(tmp_path), resume=True)
+    resumed.solve(BlackjackMDP(*params))
+    assert resumed.numIters == finished.numIters
+    assert resumed.V == finished.V
+    assert resumed.pi == finished.pi
+    assert resumed.steps == []
+
+
+# Only solves that ask for it keep the successor graph; resolve walks the
+# previous MDP itself when it is missing.
+@pytest.mark.parametrize("trackSuccessors", [False, True])
+def test_resolve_matches_cold_solve(trackSuccessors):
+    previous = BlackjackMDP([1, 2, 3, 4, 5], 2, 10, 1)
+    solved = ValueIteration(trackSuccessors=trackSuccessors)
+    solved.solve(previous, epsilon=1e-10)
+    assert (previous.successorGraph is not None) == trackSuccessors
+    for params in [([1, 2, 3, 4, 5], 2, 11, 1), ([1, 2, 3, 4, 5], 2, 10, 2)]:
+        algorithm = ValueIteration()
+        algorithm.resolve(BlackjackMDP(*params), previous, solved.V, solved.pi, epsilon=1e-10)
+        expected = solveValueIteration(BlackjackMDP(*params))
+        assert set(algorithm.V) == set(expected)
+        for state in expected:
+            assert algorithm.V[state] == pytest.approx(expected[state])
+
+
+def test_batched_variants_match_separate_solves():
+    mdps = [BlackjackMDP([1, 2, 3, 4, 5], 2, 10, peekCost) for peekCost in (0, 1, 3)]
+    algorithm = BatchedValueIteration()
+    algorithm.solveMany(mdps, epsilon=1e-10)
+    for mdp, V in zip(mdps, algorithm.Vs):
+        expected = solveValueIteration(BlackjackMDP(*mdp.parameters().values()))
+        for state in expected:
+            assert V[state] == pytest.approx(expected[state])
+    with pytest.raises(ValueError):
+        BatchedValueIteration().solveMany([BlackjackMDP([1, 2, 3, 4, 5], 2, 10, 1), BlackjackMDP([1, 2, 3, 4, 5], 2, 11, 1)])
+
+
+@pytest.mark.parametrize("algorithmClass", [ModifiedPolicyIteration, PrioritizedSweepingValueIteration, TopologicalValueIteration, LAOStar, OutOfCoreValueIteration, BatchedValueIteration])
+def test_unsupported_value_storage_is_rejected(algorithmClass):
+    with pytest.raises(ValueError):
+        algorithmClass(valueStorage="float32")
@@ -293,6 +293,134 @@ class Grid:
         return bools
 
 
+class BitGrid:
+    """
+    A Grid of booleans backed by one arbitrary-precision int: cell (x, y) is
+    bit x * height + y, the order in which Grid.__hash__ weighs its cells, so
+    both classes hash a board the same way.  grid[x][y] reads and assigns
+    through a light column view, like Grid.
+
+    Because ints are immutable, copy() shares the bits and costs O(1) no
+    matter the board size.  The number of True cells and the hash (the bits
+    modulo the prime Python's int hash reduces by) are updated on every
+    assignment, so count() and __hash__ are O(1) as well.
+    """
+
+    _HASH_MODULUS = sys.hash_info.modulus
+
+    def __init__(self, width, height, initialValue=False):
+        if initialValue not in [False, True]:
+            raise Exception('Grids can only contain booleans')
+        self.width = width
+        self.height = height
+        self.bits = (1 << (width * height)) - 1 if initialValue else 0
+        self._count = width * height if initialValue else 0
+        self._hash = self.bits % self._HASH_MODULUS
+
+    def get(self, x, y):
+        return (self.bits >> (x * self.height + y)) & 1 == 1
+
+    def set(self, x, y, value):
+        index = x * self.height + y
+        bit = 1 << index
+        if bool(self.bits & bit) == bool(value):
+            return
+        weight = pow(2, index, self._HASH_MODULUS)
+        if value:
+            self.bits |= bit
+            self._count += 1
+            self._hash = (self._hash + weight) % self._HASH_MODULUS
+        else:
+            self.bits &= ~bit
+            self._count -= 1
+            self._hash = (self._hash - weight) % self._HASH_MODULUS
+
+    def __getitem__(self, x):
+        if x < 0:
+            x += self.width
+        if not 0 <= x < self.width:
+            raise IndexError('grid column out of range')
+        return _BitGridColumn(self, x)
+
+    def __setitem__(self, x, column):
+        for y in range(self.height):
+            self.set(x, y, column[y])
+
+    @property
+    def data(self):
+        """The cells as Grid's list of columns, for code written against Grid."""
+        return [[self.get(x, y) for y in range(self.height)] for x in range(self.width)]
+
+    def __str__(self):
+        out = [[str(self.get(x, y))[0] for x in range(self.width)]
+               for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if other == None:
+            return False
+        if isinstance(other, BitGrid):
+            return self.bits == other.bits and self.height == other.height and self.width == other.width
+        return self.data == other.data
+
+    def __hash__(self):
+        return hash(self._hash)
+
+    def copy(self):
+        g = BitGrid.__new__(BitGrid)
+        g.width, g.height = self.width, self.height
+        g.bits, g._count, g._hash = self.bits, self._count, self._hash
+        return g
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        return self.copy()
+
+    def count(self, item=True):
+        return self._count if item else self.width * self.height - self._count
+
+    def asList(self, key=True):
+        bits = self.bits if key else ~self.bits & ((1 << (self.width * self.height)) - 1)
+        list = []
+        while bits:
+            low = bits & -bits
+            list.append(divmod(low.bit_length() - 1, self.height))
+            bits ^= low
+        return list
+
+
+class _BitGridColumn:
+    """Column x of a BitGrid, so that grid[x][y] works as with Grid."""
+
+    __slots__ = ('grid', 'x')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def _row(self, y):
+        if y < 0:
+            y += self.grid.height
+        if not 0 <= y < self.grid.height:
+            raise IndexError('grid row out of range')
+        return y
+
+    def __getitem__(self, y):
+        return self.grid.get(self.x, self._row(y))
+
+    def __setitem__(self, y, value):
+        self.grid.set(self.x, self._row(y), value)
+
+    def __len__(self):
+        return self.grid.height
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1, 2)):
         return bitRep
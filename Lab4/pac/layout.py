@@ -13,7 +13,7 @@
 
 
 from util import manhattanDistance
-from game import Grid
+from game import Grid, BitGrid
 import os
 import random
 from functools import reduce
@@ -30,7 +30,8 @@ class Layout:
         self.width = len(layoutText[0])
         self.height = len(layoutText)
         self.walls = Grid(self.width, self.height, False)
-        self.food = Grid(self.width, self.height, False)
+        # Food is copied on every pellet eaten, so it lives in a BitGrid (O(1) copy and count).
+        self.food = BitGrid(self.width, self.height, False)
         self.capsules = []
         self.agentPositions = []
         self.numGhosts = 0